@@ -0,0 +1,357 @@
+"""Performance benchmarks for the screen capture app.
+
+Runs headlessly against the synthetic capture backend unless a real one is
+requested, e.g.:
+
+    python benchmark.py profiles
+    python benchmark.py profiles --backend mss --frames 5
+    python benchmark.py pipeline --output results.json
+    python benchmark.py pipeline --unpaced --resolutions 1080p
+    python benchmark.py startup --max-import-ms 300
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import queue
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource  # Peak RSS on Linux and macOS
+except ImportError:
+    resource = None
+
+import cv2
+from PIL import Image
+
+import run
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4K": (3840, 2160)}
+
+
+# --- Helpers ---
+def make_backend(args):
+    """Capture backend named on the command line ("fake" needs no display)"""
+    if args.backend == "fake":
+        return run.FakeCaptureBackend(args.width, args.height, args.pattern)
+    return run.create_capture_backend(args.backend)
+
+def grab_images(backend, count):
+    """Grab count frames as PIL RGB images"""
+    images = []
+    for _ in range(count):
+        frame = backend.grab()
+        images.append(Image.fromarray(frame[:, :, ::-1]))
+    return images
+
+
+# --- Image Encoding Profiles ---
+def bench_profiles(args):
+    """Report ms/frame and bytes/frame for each encoding profile and format"""
+    backend = make_backend(args)
+    try:
+        images = grab_images(backend, args.frames)
+    finally:
+        backend.close()
+    width, height = images[0].size
+    print(f"{len(images)} frames of {width}x{height} ({backend.name}, {args.pattern})")
+    print(f"{'profile':<10} {'format':<6} {'ms/frame':>9} {'KB/frame':>9}")
+
+    for profile in args.profiles or list(run.IMAGE_PROFILES):
+        for image_format in args.formats or run.IMAGE_FORMATS:
+            params = run.image_save_params(profile, image_format)
+            pil_format = run.PIL_FORMATS.get(image_format, image_format)
+            total_bytes = 0
+            start = time.perf_counter()
+            for image in images:
+                out = io.BytesIO()
+                image.save(out, pil_format, **params)
+                total_bytes += out.tell()
+            elapsed = time.perf_counter() - start
+            print(f"{profile:<10} {image_format:<6} {elapsed * 1000 / len(images):>9.1f} "
+                  f"{total_bytes / len(images) / 1024:>9.1f}")
+
+
+# --- Recording Pipeline ---
+class NullUi:
+    """Stands in for UiBridge/Tk variables, discarding UI updates"""
+    def set(self, variable, value):
+        pass
+
+    def call(self, func, *args):
+        pass
+
+class UnpacedScheduler:
+    """Stands in for FrameScheduler without deadlines: every capture fills one slot, right away"""
+    interval = 0.0
+    frames_duplicated = frames_skipped = 0
+
+    def wait(self):
+        return 1
+
+class HeadlessRecorder:
+    """Runs ScreenCaptureApp's capture loop and segment encoder without Tk.
+
+    Borrows the app's recording methods and provides the attributes they
+    read, so the benchmark measures the same code path as a real recording.
+    Unpaced, the loop captures as fast as it can and the frame buffer never
+    spills, so a full buffer holds capture back to the encoder's pace and
+    the frame rates show what the pipeline sustains at most.
+    """
+    _recording_loop = run.ScreenCaptureApp._recording_loop
+    _report_metrics = run.ScreenCaptureApp._report_metrics
+    _update_video_progress = run.ScreenCaptureApp._update_video_progress
+
+    def __init__(self, backend, save_dir, fps, encoder, clip_seconds=5, buffer_mb=512, unpaced=False):
+        width, height = backend.screen_size()
+        self.backend = backend
+        self.settings = run.Settings(config_file=None)  # Defaults only; never touches settings.json
+        self.settings.update(video_resize_filter="bilinear", metrics_log=False,
+                             save_dir=save_dir)
+        self.ui = NullUi()
+        self.status_var = self.video_progress_var = self.metrics_var = None
+        self.frames_per_second = fps
+        self.recording_region_source = None
+        self.recording_output_size = (width, height)
+        self.recording_start_time = time.time()
+        self.is_recording = False
+        self.frames_captured = self.frames_dropped = self.frames_unchanged = 0
+        self.segments_created = 0
+        self.changed_tiles = None
+        self.frame_scheduler = None
+        self.metrics = run.PipelineMetrics(window=100000)
+        self.recording_changes = queue.SimpleQueue()  # Never fed; settings don't change mid-benchmark
+        self.unpaced = unpaced
+        self.frame_buffer = run.FrameRingBuffer(width, height, buffer_mb, os.path.join(save_dir, "spill"),
+                                                max_spill_mb=0 if unpaced else 2048)
+        self.segment_encoder = run.SegmentEncoder(self.frame_buffer, save_dir, fps, fps * clip_seconds,
+                                                  encoder=encoder, metrics=self.metrics)
+
+    def _get_capture_backend(self):
+        return self.backend
+
+    def _create_frame_scheduler(self):
+        return UnpacedScheduler() if self.unpaced else run.FrameScheduler(self.frames_per_second)
+
+    def record(self, seconds):
+        """Record for seconds, then wait for the encoder; returns (capture seconds, drain seconds)"""
+        self.is_recording = True
+        self.segment_encoder.start()
+        capture = threading.Thread(target=self._recording_loop, daemon=True)
+        start = time.perf_counter()
+        capture.start()
+        time.sleep(seconds)
+        self.is_recording = False
+        capture.join()
+        stopped = time.perf_counter()
+        self.segment_encoder.thread.join()
+        return stopped - start, time.perf_counter() - stopped
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_pipeline_case(case):
+    """Record one backend/pattern/resolution/encoder combination and return its measurements"""
+    width, height = RESOLUTIONS[case["resolution"]]
+    if case["backend"] == "fake":
+        backend = run.FakeCaptureBackend(width, height, case["pattern"])
+    else:
+        backend = run.create_capture_backend(case["backend"])
+    save_dir = tempfile.mkdtemp(prefix="capture_bench_")
+    try:
+        recorder = HeadlessRecorder(backend, save_dir, case["fps"], case["encoder"],
+                                    unpaced=case.get("unpaced", False))
+        capture_seconds, drain_seconds = recorder.record(case["seconds"])
+        snapshot = recorder.metrics.snapshot()
+        outputs = [name for name in os.listdir(save_dir) if name.endswith((".mp4", ".avi"))]
+        output_bytes = sum(os.path.getsize(os.path.join(save_dir, name)) for name in outputs)
+        encoded = recorder.segment_encoder.frames_encoded
+        return dict(case,
+                    frame_size=list(recorder.recording_output_size),
+                    capture_fps=snapshot["fps"],
+                    encoded_frames=encoded,
+                    encoded_fps=round(encoded / (capture_seconds + drain_seconds), 2),
+                    drain_seconds=round(drain_seconds, 2),
+                    dropped=recorder.frames_dropped + recorder.frame_scheduler.frames_skipped,
+                    unchanged=recorder.frames_unchanged,
+                    stages_ms={stage: list(values) if values else None
+                               for stage, values in snapshot["stages"].items()},
+                    peak_rss_mb=peak_rss_mb(),
+                    output_files=len(outputs),
+                    output_extensions=sorted({os.path.splitext(name)[1] for name in outputs}),
+                    output_bytes=output_bytes)
+    finally:
+        backend.close()
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+def bench_pipeline(args):
+    """Run every case in a fresh process (so peak RSS is per case) and write the results as JSON"""
+    results = []
+    if args.unpaced:
+        print("Unpaced: frame rates are the most the pipeline sustains, not the configured --fps")
+    print(f"{'backend':<8} {'pattern':<7} {'res':<6} {'encoder':<7} {'cap fps':>8} {'enc fps':>8} "
+          f"{'dropped':>7} {'grab p95':>9} {'enc p95':>8} {'RSS MB':>7} {'out KB':>8}")
+    for resolution in args.resolutions:
+        for pattern in args.patterns:
+            for encoder in args.encoders:
+                case = dict(backend=args.backend, pattern=pattern, resolution=resolution, encoder=encoder,
+                            fps=args.fps, seconds=args.seconds, unpaced=args.unpaced)
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), "pipeline-case", json.dumps(case)],
+                                       capture_output=True, text=True)
+                if child.returncode != 0:
+                    print(f"Case {case} failed:\n{child.stderr}")
+                    results.append(dict(case, error=child.stderr.strip().splitlines()[-1:]))
+                    continue
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                results.append(result)
+                stages = result["stages_ms"]
+                grab = stages["grab"][1] if stages["grab"] else float("nan")
+                encode = stages["encode"][1] if stages["encode"] else float("nan")
+                print(f"{args.backend:<8} {pattern:<7} {resolution:<6} {encoder:<7} {result['capture_fps']:>8.1f} "
+                      f"{result['encoded_fps']:>8.1f} {result['dropped']:>7} {grab:>9.1f} {encode:>8.1f} "
+                      f"{result['peak_rss_mb'] or 0:>7.0f} {result['output_bytes'] / 1024:>8.0f}")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "version": git_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "opencv": cv2.__version__,
+        "ffmpeg": shutil.which("ffmpeg"),
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+def bench_pipeline_case(args):
+    """Child process entry point for one pipeline case; prints its result as JSON"""
+    result = run_pipeline_case(json.loads(args.case))
+    print(json.dumps(result))
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# --- Startup ---
+HEAVY_MODULES = ["cv2", "numpy", "PIL.Image", "pyautogui"]
+
+# Run with -c in a fresh interpreter, so nothing benchmark.py imported skews the numbers
+STARTUP_PROBE = """
+import json, sys, time
+spawned, app_dir, heavy = float(sys.argv[1]), sys.argv[2], sys.argv[3].split(",")
+sys.path.insert(0, app_dir)
+start = time.perf_counter()
+import run
+result = {"import_ms": (time.perf_counter() - start) * 1000,
+          "loaded_by_import": [name for name in heavy if name in sys.modules]}
+try:
+    root = run.tk.Tk()
+except run.tk.TclError as e:
+    result["paint_error"] = str(e)
+else:
+    app = run.ScreenCaptureApp(root)
+    result["loaded_before_paint"] = [name for name in heavy if name in sys.modules]
+    deadline = time.time() + 10
+    while not root.winfo_viewable() and time.time() < deadline:
+        root.update()
+    root.update_idletasks()
+    result["first_paint_ms"] = (time.time() - spawned) * 1000
+    root.destroy()
+print(json.dumps(result))
+"""
+
+def bench_startup(args):
+    """Time `import run` and spawn-to-first-paint in fresh processes; exit 1 past --max-import-ms"""
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(args.runs):
+        work_dir = tempfile.mkdtemp(prefix="capture_startup_")  # Keeps settings.json and saved/ out of the tree
+        try:
+            child = subprocess.run([sys.executable, "-c", STARTUP_PROBE, repr(time.time()), app_dir,
+                                    ",".join(HEAVY_MODULES)], cwd=work_dir, capture_output=True, text=True, timeout=120)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if child.returncode != 0:
+            print(f"Startup run failed:\n{child.stderr}")
+            sys.exit(1)
+        runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    import_ms = statistics.median(result["import_ms"] for result in runs)
+    paint_times = [result["first_paint_ms"] for result in runs if "first_paint_ms" in result]
+    print(f"import run:   {import_ms:8.1f} ms median of {len(runs)}")
+    print(f"  loaded: {', '.join(runs[-1]['loaded_by_import']) or 'no heavy modules'}")
+    if paint_times:
+        print(f"first paint:  {statistics.median(paint_times):8.1f} ms median from process spawn")
+        print(f"  loaded before paint: {', '.join(runs[-1]['loaded_before_paint']) or 'no heavy modules'}")
+    else:
+        print(f"first paint:  not measured ({runs[-1].get('paint_error')})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "version": git_version(),
+                       "python": platform.python_version(), "platform": platform.platform(),
+                       "runs": runs}, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"FAIL: import took {import_ms:.1f} ms, budget is {args.max_import_ms} ms")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen capture benchmarks")
+    parser.add_argument("--backend", default="fake", help="fake, auto, mss or pyautogui")
+    parser.add_argument("--width", type=int, default=1920, help="Fake backend frame width")
+    parser.add_argument("--height", type=int, default=1080, help="Fake backend frame height")
+    parser.add_argument("--pattern", default="scroll", choices=["static", "scroll", "noise"],
+                        help="Fake backend content")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    profiles = commands.add_parser("profiles", help="Screenshot encoding profiles")
+    profiles.add_argument("--frames", type=int, default=10)
+    profiles.add_argument("--profiles", nargs="+", choices=list(run.IMAGE_PROFILES))
+    profiles.add_argument("--formats", nargs="+", choices=run.IMAGE_FORMATS)
+    profiles.set_defaults(func=bench_profiles)
+
+    pipeline = commands.add_parser("pipeline", help="Capture, change detection and segment encoding")
+    pipeline.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    pipeline.add_argument("--patterns", nargs="+", choices=["static", "scroll", "noise"],
+                          default=["static", "scroll", "noise"])
+    pipeline.add_argument("--encoders", nargs="+", choices=["ffmpeg", "opencv"], default=["ffmpeg", "opencv"])
+    pipeline.add_argument("--fps", type=int, default=24)
+    pipeline.add_argument("--unpaced", action="store_true",
+                          help="Capture without frame pacing to measure the highest sustained frames/s")
+    pipeline.add_argument("--seconds", type=float, default=5, help="Recording length per case")
+    pipeline.add_argument("--output", default="benchmark_results.json")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    startup = commands.add_parser("startup", help="Import time and time to first paint")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--max-import-ms", type=float, help="Fail if the median import time exceeds this")
+    startup.add_argument("--output", help="Also write the individual runs as JSON")
+    startup.set_defaults(func=bench_startup)
+
+    pipeline_case = commands.add_parser("pipeline-case")  # Used by "pipeline" to run each case in a child process
+    pipeline_case.add_argument("case")
+    pipeline_case.set_defaults(func=bench_pipeline_case)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,2447 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from PIL import Image, ImageTk
+import importlib
+import io
 import os
 import time
 from datetime import datetime
-import pyautogui
 import threading
+import queue
 import json
+import hashlib
+import math
+import struct
 import subprocess
+import shutil
+import tempfile
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, OrderedDict
 import sys
-import cv2
-import numpy as np
+
+# --- Lazy Imports ---
+class _LazyModule:
+    """Stands in for a module, importing it on first attribute access.
+
+    OpenCV, NumPy, PIL and pyautogui together take seconds to import on a
+    cold start, so they load on first use, or in the warm-up thread
+    started once the window is up, instead of before the window appears.
+    Attributes are cached on the proxy after the first lookup. An optional
+    module that can't be imported makes the proxy falsy.
+    """
+    def __init__(self, name, optional=False):
+        self.__dict__.update(_name=name, _optional=optional, _module=None, _error=None)
+
+    def _load(self):
+        if self._module is None:
+            if self._error is not None:
+                raise self._error
+            try:
+                self.__dict__['_module'] = importlib.import_module(self._name)
+            except Exception as e:
+                if not self._optional:
+                    raise
+                self.__dict__['_error'] = e
+                raise
+        return self._module
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __bool__(self):
+        try:
+            self._load()
+            return True
+        except Exception:  # Not installed, or no display to connect to (headless benchmarks)
+            return False
+
+cv2 = _LazyModule("cv2")
+np = _LazyModule("numpy")
+Image = _LazyModule("PIL.Image")
+ImageTk = _LazyModule("PIL.ImageTk")
+pyautogui = _LazyModule("pyautogui", optional=True)
+pynput_keyboard = _LazyModule("pynput.keyboard", optional=True)  # Global replay hotkey
+
+def warm_up_imports():
+    """Import the lazily loaded modules ahead of their first use"""
+    for module in (cv2, np, Image, ImageTk, pyautogui):
+        try:
+            module._load()
+        except Exception:
+            pass  # Reported where the module is actually needed
 
 # --- Settings ---
+RESOLUTION_PRESETS = {
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4K": (3840, 2160)
+}
+
+# name: (type, default, allowed values). Allowed values are a tuple of choices,
+# a range for numbers, a predicate, or None for any value of the type. A
+# callable default is called when Settings is created; a None default makes
+# None a valid value.
+SETTINGS_SCHEMA = {
+    "save_format": (str, "PNG", lambda image_format: image_format in IMAGE_FORMATS),
+    "video_format": (str, "MP4", ("MP4", "AVI", "MOV")),
+    "save_dir": (str, lambda: os.path.join(os.getcwd(), "saved"), None),
+    "video_duration_seconds": (int, 10, range(1, 3601)),  # Default 10 seconds for debugging
+    "fps": (int, 24, range(1, 61)),  # Default 24 fps
+    "clip_duration_seconds": (int, 5, range(1, 301)),  # Default 5 seconds per clip
+    "resolution_width": (int, 1280, range(320, 7681)),  # 720p default
+    "resolution_height": (int, 720, range(240, 4321)),
+    "resolution_preset": (str, "720p", tuple(RESOLUTION_PRESETS)),
+    "capture_backend": (str, "auto", ("auto", "mss", "pyautogui", "fake")),
+    "video_resize_filter": (str, "bilinear", lambda name: name in RESIZE_FILTERS),  # Fast filter for recorded frames
+    "still_resize_filter": (str, "lanczos", lambda name: name in RESIZE_FILTERS),  # High-quality filter for screenshots
+    "frame_buffer_mb": (int, 512, range(64, 16385)),  # Memory cap for buffered raw recording frames
+    "frame_spill_mb": (int, 2048, range(0, 1048577)),  # Disk budget for frames spilled once the buffer is full
+    # screen, region (the last selected region) or window (the active window)
+    "recording_target": (str, "screen", ("screen", "region", "window")),
+    "metrics_log": (bool, False, None),  # Append recording metrics to a JSON-lines file in save_dir
+    # Retention limits for files in save_dir; 0 means unlimited
+    "recordings_max_mb": (int, 0, range(0, 2 ** 31)),
+    "recordings_max_age_days": (int, 0, range(0, 2 ** 31)),
+    "recordings_max_files": (int, 0, range(0, 2 ** 31)),
+    "screenshots_max_mb": (int, 0, range(0, 2 ** 31)),
+    "screenshots_max_age_days": (int, 0, range(0, 2 ** 31)),
+    "screenshots_max_files": (int, 0, range(0, 2 ** 31)),
+    # Oldest captures are deleted to keep this much disk free; 0 turns this off
+    "min_free_disk_mb": (int, 0, range(0, 2 ** 31)),
+    "video_encoder": (str, "auto", ("auto", "ffmpeg", "opencv")),
+    "ffmpeg_preset": (str, "ultrafast", ("ultrafast", "superfast", "veryfast", "faster", "fast",
+                                         "medium", "slow", "slower", "veryslow")),  # libx264 preset for the ffmpeg encoder
+    "ffmpeg_crf": (int, 28, range(0, 52)),  # libx264 quality; lower is better and larger
+    "replay_duration_seconds": (int, 60, range(5, 601)),  # Seconds kept by the instant replay buffer
+    "replay_memory_mb": (int, 256, range(16, 8193)),  # Memory cap for the instant replay buffer
+    "replay_jpeg_quality": (int, 80, range(1, 101)),  # Compression of frames held in the replay buffer
+    "image_profile": (str, "balanced", lambda profile: profile in IMAGE_PROFILES),  # Screenshot encoding profile
+    "burst_count": (int, 10, range(0, 100001)),  # Shots per burst; 0 keeps shooting until stopped
+    "burst_interval_ms": (int, 200, range(20, 86400001)),  # Time between burst shots
+    "burst_profile": (str, "fast", lambda profile: profile in IMAGE_PROFILES),  # Encoding profile for burst shots
+    # [left, top, width, height] of the last selected capture region
+    "last_region": (list, None, lambda region: len(region) == 4 and all(isinstance(value, int) for value in region)
+                    and region[2] > 0 and region[3] > 0),
+    "skip_duplicates": (bool, False, None),  # Don't save a capture that looks like the previous one
+    # Differing hash bits (of 64) still counted as a near-duplicate
+    "duplicate_distance": (int, 4, range(0, 33)),
+}
+
 class Settings:
-    def __init__(self):
-        self.config_file = "settings.json"
-        self.save_format = "PNG"
-        self.video_format = "MP4"
-        self.save_dir = os.path.join(os.getcwd(), "saved")
-        self.video_duration_seconds = 10  # Default 10 seconds for debugging
-        self.fps = 24  # Default 24 fps
-        self.clip_duration_seconds = 5  # Default 5 seconds per clip
-        self.resolution_width = 1280  # 720p default
-        self.resolution_height = 720
-        self.resolution_preset = "720p"
+    """App settings, typed and validated against SETTINGS_SCHEMA and kept in settings.json.
+
+    Assigning a setting validates it (ValueError if it doesn't fit the
+    schema); update() applies several at once, all or nothing. Either way
+    subscribers are called with {name: value} of what actually changed, on
+    the thread that made the change. save_settings() writes a temporary
+    file and renames it over settings.json, so an interrupted save never
+    leaves a truncated file behind.
+    """
+    __slots__ = tuple(SETTINGS_SCHEMA) + ("config_file", "encoder_cache_file", "thumbnail_cache_dir",
+                                          "subscribers", "lock")
+
+    def __init__(self, config_file="settings.json"):
+        self.config_file = config_file  # None keeps the defaults and never touches the disk
+        self.encoder_cache_file = "encoder_cache.json"  # Probed video encoder capabilities
+        self.thumbnail_cache_dir = "thumbnail_cache"  # Thumbnails for the history gallery
+        self.subscribers = []
+        self.lock = threading.Lock()  # Serializes saves
+        for name, (kind, default, allowed) in SETTINGS_SCHEMA.items():
+            object.__setattr__(self, name, default() if callable(default) else default)
         
         self.load_settings()
-    
+
+    def __setattr__(self, name, value):
+        if name in SETTINGS_SCHEMA:
+            self.update(**{name: value})
+        else:
+            object.__setattr__(self, name, value)
+
+    @staticmethod
+    def validate(name, value):
+        """Return value checked against SETTINGS_SCHEMA (JSON floats/lists normalized); raises ValueError"""
+        if name not in SETTINGS_SCHEMA:
+            raise ValueError(f"Unknown setting: {name}")
+        kind, default, allowed = SETTINGS_SCHEMA[name]
+        if value is None and default is None:
+            return None
+        if kind is int and isinstance(value, float) and value.is_integer():
+            value = int(value)
+        elif kind is list and isinstance(value, tuple):
+            value = list(value)
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            raise ValueError(f"{name} must be {kind.__name__}, not {value!r}")
+        if allowed is None:
+            return value
+        if callable(allowed):
+            if not allowed(value):
+                raise ValueError(f"{name} can't be {value!r}")
+        elif value not in allowed:
+            if isinstance(allowed, range):
+                raise ValueError(f"{name} must be between {allowed.start} and {allowed[-1]}")
+            raise ValueError(f"{name} must be one of {', '.join(allowed)}")
+        return value
+
+    def update(self, **changes):
+        """Validate and apply several settings together; returns and publishes {name: value} of the changed ones"""
+        values = {name: self.validate(name, value) for name, value in changes.items()}  # Nothing applied on error
+        changed = {}
+        for name, value in values.items():
+            if getattr(self, name) != value:
+                object.__setattr__(self, name, value)
+                changed[name] = value
+        if changed:
+            for callback in list(self.subscribers):
+                try:
+                    callback(changed)
+                except Exception as e:
+                    print(f"Settings subscriber failed: {e}")
+        return changed
+
+    def subscribe(self, callback):
+        """Call callback({name: value}) whenever settings change"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
     def load_settings(self):
+        if self.config_file is None:
+            return
+        try:
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r') as f:
+                    data = json.load(f)
+                for name in SETTINGS_SCHEMA:
+                    if name in data:
+                        try:
+                            self.update(**{name: data[name]})
+                        except ValueError as e:
+                            # One bad value shouldn't throw away the rest of the file
+                            print(f"Ignoring setting from {self.config_file}: {e}")
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+    
+    def save_settings(self):
+        if self.config_file is None:
+            return
+        try:
+            data = {name: getattr(self, name) for name in SETTINGS_SCHEMA}
+            with self.lock:
+                temp_path = f"{self.config_file}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(data, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.config_file)
+        except Exception as e:
+            print(f"Error saving settings: {e}")
+    
+    def retention_limits(self):
+        """Per-kind limits in the form RetentionManager takes"""
+        return {
+            "recordings": {"max_mb": self.recordings_max_mb, "max_age_days": self.recordings_max_age_days,
+                           "max_files": self.recordings_max_files},
+            "screenshots": {"max_mb": self.screenshots_max_mb, "max_age_days": self.screenshots_max_age_days,
+                            "max_files": self.screenshots_max_files},
+        }
+
+    def set_resolution_preset(self, preset):
+        """Set resolution based on preset"""
+        if preset in RESOLUTION_PRESETS:
+            width, height = RESOLUTION_PRESETS[preset]
+            self.update(resolution_width=width, resolution_height=height, resolution_preset=preset)
+
+# --- Capture Backends ---
+class CaptureBackend:
+    """Base class for screen grabbers that return frames as BGR NumPy arrays"""
+    name = "base"
+
+    def screen_size(self):
+        """Return (width, height) of the primary screen"""
+        raise NotImplementedError
+
+    def grab(self, region=None):
+        """Grab the screen, or a (left, top, width, height) region of it, as an HxWx3 BGR array"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class MssCaptureBackend(CaptureBackend):
+    """Grabs through persistent MSS handles (XShm on X11, BitBlt on Windows, CoreGraphics on macOS)"""
+    name = "mss"
+
+    def __init__(self):
+        import mss
+        self.mss = mss
+        # MSS handles must stay on the thread that created them, so keep one per thread
+        self.local = threading.local()
+        self.handles = []
+        self._handle()
+
+    def _handle(self):
+        sct = getattr(self.local, "sct", None)
+        if sct is None:
+            sct = self.local.sct = self.mss.mss()
+            self.local.buffer = None
+            self.handles.append(sct)
+        return sct
+
+    def screen_size(self):
+        monitor = self._handle().monitors[1]
+        return monitor["width"], monitor["height"]
+
+    def grab(self, region=None):
+        sct = self._handle()
+        if region is None:
+            monitor = sct.monitors[1]
+        else:
+            left, top, width, height = region
+            monitor = {"left": left, "top": top, "width": width, "height": height}
+        shot = sct.grab(monitor)
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+        # Reuse this thread's output buffer while the grab size stays the same
+        buffer = self.local.buffer
+        if buffer is None or buffer.shape[:2] != bgra.shape[:2]:
+            buffer = self.local.buffer = np.empty((shot.height, shot.width, 3), dtype=np.uint8)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=buffer)
+        return buffer
+
+    def close(self):
+        for sct in self.handles:
+            try:
+                sct.close()
+            except Exception:
+                pass
+        self.handles = []
+        self.local = threading.local()
+
+class PyAutoGuiCaptureBackend(CaptureBackend):
+    """Fallback grabber using pyautogui.screenshot(), which builds a new PIL image per call"""
+    name = "pyautogui"
+
+    def __init__(self):
+        if not pyautogui:
+            raise RuntimeError("pyautogui is not available")
+
+    def screen_size(self):
+        width, height = pyautogui.size()
+        return width, height
+
+    def grab(self, region=None):
+        screenshot = pyautogui.screenshot(region=region)
+        return cv2.cvtColor(np.asarray(screenshot), cv2.COLOR_RGB2BGR)
+
+class FakeCaptureBackend(CaptureBackend):
+    """Headless grabber producing synthetic frames, for benchmarking without a display.
+
+    pattern is "static" (the same frame every time), "scroll" (text-like
+    rows moving up a few pixels per grab) or "noise" (full-motion random
+    content cycled from a small pool).
+    """
+    name = "fake"
+
+    def __init__(self, width=1920, height=1080, pattern="scroll"):
+        self.width = width
+        self.height = height
+        self.pattern = pattern
+        self.grabs = 0
+
+        rng = np.random.default_rng(0)
+        if pattern == "noise":
+            self.pool = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+        else:
+            # Light background with dark "text" runs every 20 pixels
+            page = np.full((height, width, 3), 235, dtype=np.uint8)
+            for row in range(8, height - 8, 20):
+                runs = rng.integers(0, 2, width // 8, dtype=np.uint8).repeat(8)[:width]
+                page[row:row + 10, :len(runs)][:, runs.astype(bool)] = 30
+            self.pool = [page]
+
+    def screen_size(self):
+        return self.width, self.height
+
+    def grab(self, region=None):
+        if self.pattern == "noise":
+            frame = self.pool[self.grabs % len(self.pool)]
+        elif self.pattern == "scroll":
+            frame = np.roll(self.pool[0], -4 * self.grabs, axis=0)
+        else:
+            frame = self.pool[0]
+        self.grabs += 1
+        if region is not None:
+            left, top, width, height = region
+            frame = frame[top:top + height, left:left + width]
+        return frame
+
+CAPTURE_BACKENDS = {
+    "mss": MssCaptureBackend,
+    "pyautogui": PyAutoGuiCaptureBackend,
+    "fake": FakeCaptureBackend,
+}
+
+def create_capture_backend(name="auto"):
+    """Create the named capture backend; "auto" prefers MSS and falls back to pyautogui"""
+    candidates = ["mss", "pyautogui"] if name == "auto" else [name, "pyautogui"]
+    errors = []
+    for candidate in candidates:
+        try:
+            backend = CAPTURE_BACKENDS[candidate]()
+            print(f"Using capture backend: {backend.name}")
+            return backend
+        except Exception as e:
+            errors.append(f"{candidate}: {e}")
+    raise RuntimeError("No capture backend available (" + "; ".join(errors) + ")")
+
+# --- Frame Resizing ---
+# OpenCV interpolation flags selectable from settings (looked up on first resize, so OpenCV loads lazily)
+RESIZE_FILTERS = {
+    "nearest": "INTER_NEAREST",
+    "bilinear": "INTER_LINEAR",
+    "area": "INTER_AREA",
+    "bicubic": "INTER_CUBIC",
+    "lanczos": "INTER_LANCZOS4",
+}
+
+def fit_within(width, height, max_width, max_height):
+    """Scale (width, height) down to fit inside the max size, keeping the aspect ratio; never scales up"""
+    scale = min(1.0, max_width / width, max_height / height)
+    return max(2, int(width * scale)), max(2, int(height * scale))
+
+class FrameResizer:
+    """Resizes BGR frames to a target size with a chosen filter, reusing one output buffer.
+
+    The returned array is only valid until the next resize() call, so callers
+    that keep frames (e.g. the ring buffer) must copy them.
+    """
+    def __init__(self, width, height, filter_name="area"):
+        self.buffer = None
+        self.configure(width, height, filter_name)
+
+    def configure(self, width, height, filter_name):
+        """Change the target size or filter, dropping the output buffer if the size changed"""
+        if (getattr(self, "width", None), getattr(self, "height", None)) != (width, height):
+            self.buffer = None
+        self.width = width
+        self.height = height
+        self.filter_name = filter_name
+        self.interpolation = None  # Resolved on the next resize
+
+    def resize(self, frame):
+        # Nothing to do when the grab already has the target size
+        if frame.shape[1] == self.width and frame.shape[0] == self.height:
+            return frame
+        if self.buffer is None:
+            self.buffer = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        if self.interpolation is None:
+            self.interpolation = getattr(cv2, RESIZE_FILTERS.get(self.filter_name, "INTER_AREA"))
+        cv2.resize(frame, (self.width, self.height), dst=self.buffer, interpolation=self.interpolation)
+        return self.buffer
+
+# --- Change Detection ---
+class FrameDiffer:
+    """Finds which tiles of a frame changed since the previous one.
+
+    Compares every pixel of the frame against the previous one, with rows
+    viewed as 64-bit words (channels folded into columns), and reduces the
+    differences per tile, so ruling out a static 1080p screen takes under a
+    millisecond. The check is exact: frames it calls unchanged are dropped
+    or repeated, so a one-pixel change must never be missed.
+    """
+    def __init__(self, tile_size=64):
+        self.tile_size = tile_size
+        self.previous = None
+
+    def compare(self, frame):
+        """Return a boolean (rows, cols) mask of changed tiles; everything counts as changed on the first frame"""
+        frame = np.ascontiguousarray(frame)
+        row_bytes = frame.shape[1] * frame.shape[2]
+        tile_bytes = self.tile_size * frame.shape[2]
+        # Widest word that divides both a row and a tile, so tiles stay whole words
+        word = next(size for size in (8, 4, 2, 1) if row_bytes % size == 0 and tile_bytes % size == 0)
+        sample = frame.reshape(frame.shape[0], row_bytes).view(f"u{word}")
+        row_tile = self.tile_size
+        col_tile = tile_bytes // word
+
+        if self.previous is None or self.previous.shape != sample.shape or self.previous.dtype != sample.dtype:
+            self.previous = sample.copy()
+            return np.ones((-(-sample.shape[0] // row_tile), -(-sample.shape[1] // col_tile)), dtype=bool)
+
+        changed = sample != self.previous
+        rows = -(-changed.shape[0] // row_tile)
+        cols = -(-changed.shape[1] // col_tile)
+        if not changed.any():
+            return np.zeros((rows, cols), dtype=bool)
+
+        # Reduce across columns first; the row reduction then runs on a small array
+        changed = np.logical_or.reduceat(changed, np.arange(0, changed.shape[1], col_tile), axis=1)
+        changed = np.logical_or.reduceat(changed, np.arange(0, changed.shape[0], row_tile), axis=0)
+        np.copyto(self.previous, sample)
+        return changed
+
+    def reset(self):
+        self.previous = None
+
+# --- Frame Buffer ---
+class FrameRingBuffer:
+    """Preallocated ring buffer of raw BGR frames that spills to disk when full.
+
+    Acts as the bounded queue between the capture thread (push) and the
+    encoder thread (get/consume). Each stored frame carries a repeat count:
+    the number of consecutive video frames it stands for. The encoder
+    consumes one repeat at a time, and the newest frame stays in place once
+    spent so an unchanged capture can extend it instead of storing a copy.
+    """
+    def __init__(self, width, height, max_memory_mb, spill_dir, max_spill_mb=2048, journal=None):
+        self.width = width
+        self.height = height
+        self.spill_dir = spill_dir
+        self.journal = journal  # Optional RecordingJournal noting spilled frames for crash recovery
+
+        # Size the ring from the memory cap, halving it if the allocation fails
+        frame_bytes = width * height * 3
+        capacity = max(1, int(max_memory_mb * 1024 * 1024) // frame_bytes)
+        while True:
+            try:
+                self.frames = np.empty((capacity, height, width, 3), dtype=np.uint8)
+                break
+            except MemoryError:
+                if capacity == 1:
+                    raise
+                capacity //= 2
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.repeats = np.zeros(capacity, dtype=np.int32)  # Video frames still to be written per slot
+        self.max_spill_frames = int(max_spill_mb * 1024 * 1024) // frame_bytes
+
+        self.start = 0  # Index of the oldest buffered frame
+        self.count = 0  # Frames currently held in memory
+        self.spilled = []  # [path, timestamp, repeat] of frames written to disk, oldest first
+        self.spill_counter = 0
+        self.spill_cache = (None, None)  # Last spilled frame loaded back, reused across its repeats
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        with self.cond:
+            return self.count + len(self.spilled)
+
+    def push(self, frame, timestamp, timeout=0, repeat=1):
+        """Store a frame, waiting up to timeout for a free slot before spilling to disk.
+
+        Returns False if the frame had to be dropped because both the ring
+        and the spill budget are full.
+        """
+        with self.cond:
+            self._drop_spent_head(incoming=True)
+
+            # Backpressure: give the encoder a chance to free a slot first
+            if self.count >= self.capacity and timeout > 0:
+                self.cond.wait_for(lambda: self.count < self.capacity, timeout)
+
+            # Once frames have spilled, keep spilling until the backlog drains so order is preserved
+            if self.count < self.capacity and not self.spilled:
+                index = (self.start + self.count) % self.capacity
+                np.copyto(self.frames[index], frame)
+                self.timestamps[index] = timestamp
+                self.repeats[index] = repeat
+                self.count += 1
+            elif len(self.spilled) < self.max_spill_frames:
+                try:
+                    self._spill(frame, timestamp, repeat)
+                except OSError as e:
+                    print(f"Frame spill failed: {e}")
+                    return False
+            else:
+                return False
+            self.cond.notify_all()
+            return True
+
+    def extend_last(self, repeat):
+        """Add repeats to the newest frame instead of storing an identical copy.
+
+        Returns False if there is no frame left to extend.
+        """
+        with self.cond:
+            if self.spilled:
+                self.spilled[-1][2] += repeat
+                if self.journal:
+                    self.journal.append("extend", path=self.spilled[-1][0], repeat=int(self.spilled[-1][2]))
+            elif self.count:
+                self.repeats[(self.start + self.count - 1) % self.capacity] += repeat
+            else:
+                return False
+            self.cond.notify_all()
+            return True
+
+    def _spill(self, frame, timestamp, repeat):
+        """Write a frame to disk as raw .npy data"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"spill_{self.spill_counter:06d}.npy")
+        self.spill_counter += 1
+        np.save(path, frame)
+        self.spilled.append([path, timestamp, repeat])
+        if self.journal:
+            self.journal.append("spill", path=path, timestamp=float(timestamp), repeat=int(repeat))
+
+    def _head_repeats(self):
+        if self.count:
+            return int(self.repeats[self.start])
+        if self.spilled:
+            return self.spilled[0][2]
+        return 0
+
+    def _drop_spent_head(self, incoming=False):
+        """Discard the oldest frame once fully written, unless it is the newest one and may still be extended"""
+        if len(self.spilled) + self.count and self._head_repeats() <= 0:
+            if incoming or self.closed or self.count + len(self.spilled) > 1:
+                self.discard()
+
+    def get(self, timeout=None):
+        """Wait for a frame to encode and return (frame, timestamp, repeats_left) without removing it.
+
+        Returns None if nothing is pending after timeout or once the buffer
+        is closed and drained. Call consume() after writing the frame once.
+        """
+        with self.cond:
+            def ready():
+                self._drop_spent_head()
+                return self._head_repeats() > 0 or self.closed
+            self.cond.wait_for(ready, timeout)
+            if self._head_repeats() <= 0:
+                return None
+            return self.peek()
+
+    def consume(self):
+        """Mark one repeat of the oldest frame as written"""
+        with self.cond:
+            if self.count:
+                self.repeats[self.start] -= 1
+            elif self.spilled:
+                self.spilled[0][2] -= 1
+            else:
+                raise IndexError("consume from empty frame buffer")
+            self._drop_spent_head()
+            self.cond.notify_all()
+
+    def peek(self):
+        """Return the oldest frame with its timestamp and remaining repeats without removing it"""
+        with self.cond:
+            if self.count:
+                return self.frames[self.start], self.timestamps[self.start], int(self.repeats[self.start])
+            if self.spilled:
+                path, timestamp, repeat = self.spilled[0]
+                if self.spill_cache[0] != path:
+                    self.spill_cache = (path, np.load(path))
+                return self.spill_cache[1], timestamp, repeat
+            raise IndexError("peek from empty frame buffer")
+
+    def discard(self):
+        """Drop the oldest frame, freeing its slot or spill file"""
+        with self.cond:
+            if self.count:
+                self.start = (self.start + 1) % self.capacity
+                self.count -= 1
+            elif self.spilled:
+                path = self.spilled.pop(0)[0]
+                self.spill_cache = (None, None)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                raise IndexError("discard from empty frame buffer")
+            self.cond.notify_all()
+
+    def close(self):
+        """Mark the buffer as finished so waiting consumers wake up"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def clear(self):
+        """Drop all buffered frames and delete any spill files"""
+        with self.cond:
+            self.start = 0
+            self.count = 0
+            for path, _, _ in self.spilled:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.spilled = []
+            self.spill_cache = (None, None)
+            self.cond.notify_all()
+        try:
+            os.rmdir(self.spill_dir)
+        except OSError:
+            pass
+
+# --- Frame Scheduling ---
+class FrameScheduler:
+    """Paces a capture loop against absolute frame deadlines on the monotonic clock.
+
+    Deadlines are start + n * interval, so time spent capturing never
+    accumulates as drift. wait() returns how many frame slots the next
+    capture has to fill: 1 when on time, more when capture fell behind and
+    the frame must be duplicated to hold the nominal rate. A backlog larger
+    than max_catchup_frames (e.g. after a stall) is skipped instead.
+    Setting stop_event cuts a pending wait short.
+    """
+    def __init__(self, fps, max_catchup_frames=None, stop_event=None):
+        self.interval = 1.0 / fps
+        self.max_catchup_frames = max_catchup_frames or max(1, int(round(fps)))
+        self.stop_event = stop_event
+        self.start_time = None
+        self.next_slot = 0
+        self.frames_duplicated = 0
+        self.frames_skipped = 0
+
+    def wait(self):
+        """Sleep until the next frame deadline and return the number of slots to fill"""
+        now = time.monotonic()
+        if self.start_time is None:
+            self.start_time = now
+        deadline = self.start_time + self.next_slot * self.interval
+        if now < deadline:
+            if self.stop_event is not None:
+                self.stop_event.wait(deadline - now)
+            else:
+                time.sleep(deadline - now)
+            now = time.monotonic()
+
+        # Every slot whose deadline has passed is covered by this capture
+        current_slot = max(self.next_slot, int((now - self.start_time) / self.interval))
+        slots = current_slot - self.next_slot + 1
+        if slots > self.max_catchup_frames:
+            self.frames_skipped += slots - 1
+            slots = 1
+        else:
+            self.frames_duplicated += slots - 1
+        self.next_slot = current_slot + 1
+        return slots
+
+# --- Pipeline Metrics ---
+class PipelineMetrics:
+    """Rolling latency samples and counters for the recording pipeline stages.
+
+    Capture, encoder and writer threads call record() with each stage's
+    duration; snapshot() reduces the last window samples per stage to p50
+    and p95 milliseconds alongside the achieved capture rate and bytes
+    written.
+    """
+    STAGES = ("grab", "resize", "diff", "queue_wait", "encode", "disk_write")
+
+    def __init__(self, window=240):
+        self.lock = threading.Lock()
+        self.samples = {stage: deque(maxlen=window) for stage in self.STAGES}
+        self.capture_times = deque(maxlen=window)  # Monotonic time of each capture
+        self.bytes_written = 0
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def frame_captured(self):
+        with self.lock:
+            self.capture_times.append(time.monotonic())
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.bytes_written += count
+
+    def snapshot(self):
+        """Return {"stages": {stage: (p50_ms, p95_ms) or None}, "fps": float, "bytes_written": int}"""
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+            capture_times = list(self.capture_times)
+            bytes_written = self.bytes_written
+        stages = {}
+        for stage, values in samples.items():
+            if values:
+                p50, p95 = np.percentile(values, [50, 95]) * 1000
+                stages[stage] = (round(float(p50), 2), round(float(p95), 2))
+            else:
+                stages[stage] = None
+        fps = 0.0
+        if len(capture_times) > 1 and capture_times[-1] > capture_times[0]:
+            fps = (len(capture_times) - 1) / (capture_times[-1] - capture_times[0])
+        return {"stages": stages, "fps": round(fps, 2), "bytes_written": bytes_written}
+
+# --- Video Encoding ---
+# Codecs to try in order of preference, with the container extension each needs
+VIDEO_CODECS = [
+    ('mp4v', '.mp4'),
+    ('XVID', '.avi'),
+    ('MJPG', '.avi'),
+    ('H264', '.mp4')
+]
+
+class FfmpegVideoWriter:
+    """Streams raw BGR frames over stdin to a local ffmpeg process encoding H.264.
+
+    Mirrors the parts of the cv2.VideoWriter interface the encoder uses
+    (isOpened, write, release) so the two can be swapped freely.
+    """
+    def __init__(self, output_path, fps, frame_size, preset="ultrafast", crf=28, ffmpeg_path=None):
+        ffmpeg_path = ffmpeg_path or shutil.which("ffmpeg")
+        if not ffmpeg_path:
+            raise RuntimeError("ffmpeg not found on PATH")
+        width, height = frame_size
+        command = [
+            ffmpeg_path, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            "-an", "-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+            # yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+            output_path
+        ]
+        self.output_path = output_path
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def write(self, frame):
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        """Close stdin and wait for ffmpeg to finish the file"""
+        try:
+            _, stderr = self.process.communicate()
+        except (OSError, ValueError):
+            # stdin already broken; just collect the exit status
+            stderr = self.process.stderr.read()
+            self.process.wait()
+        if self.process.returncode != 0:
+            print(f"ffmpeg exited with code {self.process.returncode}: {stderr.decode(errors='replace').strip()}")
+
+def open_opencv_writer(output_path, fps, frame_size):
+    """Open a cv2.VideoWriter with the first codec that works, returning (writer, path)"""
+    for codec, ext in VIDEO_CODECS:
+        video_writer = None
+        try:
+            print(f"Trying codec: {codec}")
+            fourcc = cv2.VideoWriter_fourcc(*codec)
+            temp_path = os.path.splitext(output_path)[0] + ext
+            video_writer = cv2.VideoWriter(temp_path, fourcc, fps, frame_size)
+            if video_writer.isOpened():
+                print(f"Successfully opened video writer with codec: {codec}")
+                return video_writer, temp_path
+            video_writer.release()
+        except Exception as e:
+            print(f"Failed with codec {codec}: {e}")
+            if video_writer:
+                video_writer.release()
+    raise Exception("Could not create video writer with any codec")
+
+def open_video_writer(output_path, fps, frame_size, encoder="auto", preset="ultrafast", crf=28, capabilities=None):
+    """Open a writer for the chosen encoder, returning (writer, path).
+
+    "auto" and "ffmpeg" stream to ffmpeg/libx264 when it is installed and
+    fall back to the OpenCV writer otherwise. With probed capabilities the
+    writer is built straight from the cached choice; the codec-by-codec
+    probe only runs if that fails.
+    """
+    use_ffmpeg = encoder in ("auto", "ffmpeg")
+    if capabilities is not None:
+        use_ffmpeg = use_ffmpeg and capabilities.get("ffmpeg_libx264")
+    if use_ffmpeg:
+        try:
+            ffmpeg_path = capabilities.get("ffmpeg") if capabilities else None
+            video_writer = FfmpegVideoWriter(output_path, fps, frame_size, preset=preset, crf=crf,
+                                             ffmpeg_path=ffmpeg_path)
+            if video_writer.isOpened():
+                return video_writer, output_path
+            video_writer.release()
+        except Exception as e:
+            print(f"ffmpeg encoder unavailable, falling back to OpenCV: {e}")
+
+    if capabilities and capabilities.get("opencv_codec"):
+        path = os.path.splitext(output_path)[0] + capabilities["opencv_ext"]
+        video_writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*capabilities["opencv_codec"]), fps, frame_size)
+        if video_writer.isOpened():
+            return video_writer, path
+        video_writer.release()
+        print(f"Cached codec {capabilities['opencv_codec']} failed, probing again")
+    return open_opencv_writer(output_path, fps, frame_size)
+
+class EncoderProbe:
+    """Finds the working video encoders once and caches the result next to settings.json.
+
+    The cache is reused until the OpenCV version or the ffmpeg on PATH
+    changes, so segment rollover never has to try codecs one by one.
+    """
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.capabilities = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Probe (or load the cache) in the background"""
+        threading.Thread(target=self.get, daemon=True).start()
+
+    def get(self):
+        """Return the capabilities, waiting for a probe in progress if needed"""
+        with self.lock:
+            if self.capabilities is None:
+                self.capabilities = self._load() or self._probe()
+            return self.capabilities
+
+    def _load(self):
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r') as f:
+                    data = json.load(f)
+                if data.get('cv2_version') == cv2.__version__ and data.get('ffmpeg') == shutil.which("ffmpeg"):
+                    return data
+        except Exception as e:
+            print(f"Error loading encoder cache: {e}")
+        return None
+
+    def _probe(self):
+        """Check ffmpeg for libx264 and find the first OpenCV codec that can write a frame"""
+        print("Probing video encoders...")
+        ffmpeg_path = shutil.which("ffmpeg")
+        data = {
+            'cv2_version': cv2.__version__,
+            'ffmpeg': ffmpeg_path,
+            'ffmpeg_libx264': False,
+            'opencv_codec': None,
+            'opencv_ext': None,
+            'probed_at': datetime.now().isoformat(timespec='seconds')
+        }
+
+        if ffmpeg_path:
+            try:
+                result = subprocess.run([ffmpeg_path, "-hide_banner", "-encoders"], capture_output=True, text=True,
+                                        timeout=10, creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+                data['ffmpeg_libx264'] = "libx264" in result.stdout
+            except Exception as e:
+                print(f"ffmpeg probe failed: {e}")
+
+        probe_dir = tempfile.mkdtemp(prefix="encoder_probe_")
+        try:
+            frame = np.zeros((64, 64, 3), dtype=np.uint8)
+            for codec, ext in VIDEO_CODECS:
+                path = os.path.join(probe_dir, f"probe{ext}")
+                video_writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), 24, (64, 64))
+                opened = video_writer.isOpened()
+                if opened:
+                    video_writer.write(frame)
+                video_writer.release()
+                if opened and os.path.exists(path) and os.path.getsize(path) > 0:
+                    data['opencv_codec'], data['opencv_ext'] = codec, ext
+                    break
+        finally:
+            shutil.rmtree(probe_dir, ignore_errors=True)
+
+        print(f"Encoder probe: ffmpeg/libx264={data['ffmpeg_libx264']}, opencv codec={data['opencv_codec']}")
+        try:
+            with open(self.cache_file, 'w') as f:
+                json.dump(data, f, indent=2)
+        except Exception as e:
+            print(f"Error saving encoder cache: {e}")
+        return data
+
+def append_to_manifests(playlist_path, concat_path, video_path, frame_count, fps, first_timestamp=None,
+                        last_timestamp=None):
+    """Add a finished segment to a session's .m3u playlist and .ffconcat list.
+
+    Durations are playback time (frame_count / fps). The title gives the
+    capture time, and the capture time range when the segment covered more
+    wall-clock time than it plays for (frames were dropped).
+    """
+    filename = os.path.basename(video_path)
+    duration = frame_count / fps
+    title = filename
+    if first_timestamp is not None:
+        title += f" ({datetime.fromtimestamp(first_timestamp).strftime('%H:%M:%S.%f')[:-3]}"
+        if last_timestamp is not None and last_timestamp - first_timestamp >= duration:
+            title += f" - {datetime.fromtimestamp(last_timestamp + 1 / fps).strftime('%H:%M:%S.%f')[:-3]}"
+        title += ")"
+    with open(playlist_path, 'a') as f:
+        f.write(f"#EXTINF:{math.ceil(duration)},{title}\n{filename}\n")
+    with open(concat_path, 'a') as f:
+        f.write(f"file '{filename}'\nduration {duration:.6f}\n")
+
+class DiskFullError(OSError):
+    """Free disk space is below the configured floor, so no new file is started"""
+
+class RollingVideoWriter:
+    """Writes one continuous recording as fixed-length files, rotating exactly on frame boundaries.
+
+    The next file's writer is opened ahead of time and finished files are
+    released on a helper thread, so a rollover is only a swap. Every
+    finished file is appended to two manifests: an .m3u playlist that any
+    player starts on immediately, and an .ffconcat list for joining the
+    segments without gaps (ffmpeg -f concat -i <list> -c copy out.mp4).
+    """
+    def __init__(self, save_dir, start_time, fps, frames_per_segment, open_writer, on_segment=None, metrics=None,
+                 journal=None, space_check=None):
+        self.save_dir = save_dir
+        self.fps = fps
+        self.frames_per_segment = frames_per_segment
+        self.open_writer = open_writer  # Called with a path, returns (writer, actual_path)
+        self.on_segment = on_segment  # Called with (video_path, timestamps) once a file is finished
+        self.metrics = metrics  # Optional PipelineMetrics for file finishing time and size
+        self.journal = journal  # Optional RecordingJournal noting every file opened and finished
+        self.space_check = space_check  # Optional callable; False means there is no room for another file
+
+        self.session_name = f"screen_recording_{datetime.fromtimestamp(start_time).strftime('%Y%m%d_%H%M%S')}"
+        self.playlist_path = os.path.join(save_dir, f"{self.session_name}.m3u")
+        self.concat_path = os.path.join(save_dir, f"{self.session_name}.ffconcat")
+        self.segment_index = 0
+        self.timestamps = []  # Capture time of every frame in the current file
+        self.frames_written = 0  # Frames in the files before the current one
+        self.executor = ThreadPoolExecutor(max_workers=1)  # Opens and finishes files in order
+
+        os.makedirs(save_dir, exist_ok=True)
+        # The first file is opened synchronously so failures surface to the caller,
+        # before any manifest is written
+        self.writer, self.path = self._open_segment(0, 0)
+        with open(self.playlist_path, 'w') as f:
+            f.write("#EXTM3U\n")
+        with open(self.concat_path, 'w') as f:
+            f.write("ffconcat version 1.0\n")
+        if self.journal:
+            self.journal.append("manifests", sync=True, playlist=self.playlist_path, concat=self.concat_path)
+        self._preopen_next()
+
+    def _segment_path(self, index):
+        return os.path.join(self.save_dir, f"{self.session_name}_{index:04d}.mp4")
+
+    def _open_segment(self, index, first_frame):
+        if self.space_check and not self.space_check():
+            raise DiskFullError("Not enough free disk space for the next segment")
+        video_writer, video_path = self.open_writer(self._segment_path(index))
+        if self.journal:
+            self.journal.append("segment", sync=True, index=index, path=video_path, first_frame=first_frame)
+        return video_writer, video_path
+
+    def _preopen_next(self):
+        """Open the next file on the helper thread, journaled with the frame it starts on at the current clip length"""
+        self.next_first_frame = self.frames_written + self.frames_per_segment
+        self.next_writer = self.executor.submit(self._open_segment, self.segment_index + 1, self.next_first_frame)
+
+    def write(self, frame, timestamp):
+        self.writer.write(frame)
+        self.timestamps.append(float(timestamp))
+        if len(self.timestamps) >= self.frames_per_segment:
+            self._rotate()
+
+    def _rotate(self):
+        """Hand the full file to the helper thread and switch to the pre-opened one"""
+        self.executor.submit(self._finish_segment, self.writer, self.path, self.timestamps)
+        self.frames_written += len(self.timestamps)
+        # The old file now belongs to the helper; if no new one opens, close() must not finish it again
+        self.writer, self.path, self.timestamps = None, None, []
+        self.segment_index += 1
+        try:
+            self.writer, self.path = self.next_writer.result()
+            if self.journal and self.next_first_frame != self.frames_written:
+                # The clip length changed while the previous file was written
+                self.journal.append("segment", sync=True, index=self.segment_index, path=self.path,
+                                    first_frame=self.frames_written)
+        except Exception as e:
+            print(f"Pre-opened segment writer failed ({e}), opening directly")
+            self.writer, self.path = self._open_segment(self.segment_index, self.frames_written)
+        self.timestamps = []
+        self._preopen_next()
+
+    def _finish_segment(self, video_writer, video_path, timestamps):
+        """Release a full file and append it to the manifests"""
+        started = time.perf_counter()
+        video_writer.release()
+        if not (os.path.exists(video_path) and os.path.getsize(video_path) > 0):
+            print(f"Video file was not created or is empty: {video_path}")
+            return
+        if self.metrics:
+            self.metrics.record("disk_write", time.perf_counter() - started)
+            self.metrics.add_bytes(os.path.getsize(video_path))
+        append_to_manifests(self.playlist_path, self.concat_path, video_path, len(timestamps), self.fps,
+                            timestamps[0], timestamps[-1])
+        if self.journal:
+            self.journal.append("segment_done", sync=True, path=video_path, frames=len(timestamps))
+        if self.on_segment:
+            self.on_segment(video_path, timestamps)
+
+    def close(self):
+        """Finish the current file and discard the unused pre-opened one"""
+        if self.writer is None:
+            pass  # Handed off by _rotate, and no new file could be opened
+        elif self.timestamps:
+            self.executor.submit(self._finish_segment, self.writer, self.path, self.timestamps)
+        else:
+            self.executor.submit(self._discard_writer, self.writer, self.path)
+        try:
+            unused_writer, unused_path = self.next_writer.result()
+            self.executor.submit(self._discard_writer, unused_writer, unused_path)
+        except Exception:
+            pass
+        self.executor.shutdown(wait=True)
+
+    def _discard_writer(self, video_writer, video_path):
+        video_writer.release()
+        try:
+            os.remove(video_path)
+        except OSError:
+            pass
+        if self.journal:
+            self.journal.append("segment_done", path=video_path, frames=0)
+
+class SegmentEncoder:
+    """Background encoder stage that drains a FrameRingBuffer into a rolling set of video segments"""
+    def __init__(self, frame_buffer, save_dir, fps, frames_per_clip, encoder="auto", encoder_options=None,
+                 encoder_probe=None, on_segment=None, on_status=None, on_finished=None, metrics=None,
+                 journal=None, space_check=None):
+        self.frame_buffer = frame_buffer
+        self.save_dir = save_dir
+        self.fps = fps
+        self.frames_per_clip = frames_per_clip
+        self.encoder = encoder  # auto, ffmpeg or opencv
+        self.encoder_options = encoder_options or {}  # preset/crf for the ffmpeg encoder
+        self.encoder_probe = encoder_probe  # EncoderProbe with the cached codec choice
+        self.on_segment = on_segment  # Called with (video_path, frame_count, timestamps) after each segment
+        self.on_status = on_status  # Called with a status message
+        self.on_finished = on_finished  # Called once all frames have been encoded
+        self.metrics = metrics  # Optional PipelineMetrics for encode and disk write times
+        self.journal = journal  # Optional RecordingJournal, deleted once everything is encoded
+        self.space_check = space_check  # Checked before each segment file is opened
+        self.error = None  # Exception that stopped the encoder early, if any
+
+        self.rolling_writer = None
+        self.segments_created = 0
+        self.frames_encoded = 0
+        self.start_time = None  # Capture time of the first frame
+        self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def finish(self):
+        """Signal that capture has stopped; remaining frames are encoded before the thread exits"""
+        self.frame_buffer.close()
+
+    def set_frames_per_clip(self, frames_per_clip):
+        """Change the clip length mid-recording; the file being written already uses it"""
+        self.frames_per_clip = frames_per_clip
+        if self.rolling_writer is not None:
+            self.rolling_writer.frames_per_segment = frames_per_clip
+
+    def _status(self, message):
+        if self.on_status:
+            self.on_status(message)
+
+    def _encode_loop(self):
+        """Write buffered frames to the rolling writer, which rotates files every frames_per_clip frames"""
+        video_writer = None
+        try:
+            while True:
+                item = self.frame_buffer.get(timeout=0.25)
+                if item is None:
+                    if self.frame_buffer.closed:
+                        break
+                    continue
+
+                frame, timestamp, repeat = item
+                if video_writer is None:
+                    try:
+                        video_writer = self.rolling_writer = self._open_rolling_writer(self._nominal_time(timestamp))
+                    except DiskFullError:
+                        raise  # Writing PNGs instead would fill the disk further: stop the recording
+                    except Exception as e:
+                        print(f"Error creating video: {e}")
+                        self._status(f"Video creation failed: {str(e)}")
+                        # Fallback: save this segment's frames with instructions
+                        self._save_frames_with_instructions(timestamp)
+                        continue
+
+                # Repeated frames are written once per video frame they stand for,
+                # which keeps playback in real time
+                started = time.perf_counter()
+                video_writer.write(frame, timestamp)
+                if self.metrics:
+                    self.metrics.record("encode", time.perf_counter() - started)
+                self.frames_encoded += 1
+                self.frame_buffer.consume()
+        except Exception as e:
+            print(f"Error in encoder loop: {e}")
+            self.error = e
+            self._status(f"Error saving video segment: {e}")
+        finally:
+            if video_writer is not None:
+                video_writer.close()
+            self.frame_buffer.clear()
+            if self.journal:
+                self.journal.finish()
+            if self.on_finished:
+                self.on_finished()
+
+    def _nominal_time(self, timestamp):
+        """Playback-clock time of the next frame: first capture time plus frames written so far"""
+        if self.start_time is None:
+            self.start_time = timestamp
+        return self.start_time + self.frames_encoded / self.fps
+
+    def _open_rolling_writer(self, start_time):
+        """Start the session's rolling writer, named after the time of its first frame"""
+        frame_size = (self.frame_buffer.width, self.frame_buffer.height)
+        capabilities = self.encoder_probe.get() if self.encoder_probe else None
+
+        def open_writer(video_path):
+            print(f"Creating video segment {video_path} ({frame_size[0]}x{frame_size[1]})")
+            return open_video_writer(video_path, self.fps, frame_size, self.encoder,
+                                     capabilities=capabilities, **self.encoder_options)
+
+        return RollingVideoWriter(self.save_dir, start_time, self.fps, self.frames_per_clip, open_writer,
+                                  on_segment=self._on_segment_finished, metrics=self.metrics,
+                                  journal=self.journal, space_check=self.space_check)
+
+    def _on_segment_finished(self, video_path, timestamps):
+        """Report a finished file (runs on the rolling writer's helper thread)"""
+        self.segments_created += 1
+        file_size = os.path.getsize(video_path) / (1024 * 1024)  # MB
+        # Compare wall-clock span of the captures with the nominal playback length
+        captured_span = timestamps[-1] - timestamps[0] + 1.0 / self.fps
+        print(f"Video created successfully: {video_path} ({file_size:.1f} MB, "
+              f"{len(timestamps)} frames, {len(timestamps) / self.fps:.2f}s playback, {captured_span:.2f}s captured)")
+        self._status(f"Video segment saved: {os.path.basename(video_path)} ({file_size:.1f} MB)")
+        if self.on_segment:
+            self.on_segment(video_path, len(timestamps), timestamps)
+
+    def _save_frames_with_instructions(self, start_time):
+        """Fallback that writes one segment's frames as PNGs with instructions when video creation fails"""
+        try:
+            # Create a frames directory for this video segment
+            video_start_time = datetime.fromtimestamp(start_time)
+            frames_dir_name = f"frames_{video_start_time.strftime('%Y%m%d_%H%M%S')}"
+            frames_dir = os.path.join(self.save_dir, frames_dir_name)
+            os.makedirs(frames_dir, exist_ok=True)
+            
+            # Write the segment's buffered frames to the frames directory with sequential numbering
+            total_frames = 0
+            while total_frames < self.frames_per_clip:
+                item = self.frame_buffer.get(timeout=0.25)
+                if item is None:
+                    if self.frame_buffer.closed:
+                        break
+                    continue
+                frame, timestamp, repeat = item
+                cv2.imwrite(os.path.join(frames_dir, f"frame_{total_frames:04d}.png"), frame)
+                self.frame_buffer.consume()
+                total_frames += 1
+            
+            # Create a README file with instructions
+            readme_path = os.path.join(frames_dir, "README.txt")
+            with open(readme_path, 'w') as f:
+                f.write("Video Recording Frames\n")
+                f.write("=====================\n\n")
+                f.write(f"Recording started: {video_start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write(f"Total frames: {total_frames}\n")
+                f.write(f"Frame rate: {self.fps} fps\n")
+                f.write(f"Duration: {total_frames / self.fps:.1f} seconds\n\n")
+                f.write("To create a video from these frames:\n")
+                f.write("1. Install FFmpeg from https://ffmpeg.org/download.html\n")
+                f.write("2. Open command prompt in this directory\n")
+                f.write(f"3. Run: ffmpeg -framerate {self.fps} -i frame_%04d.png -c:v libx264 -pix_fmt yuv420p output.mp4\n\n")
+                f.write("Or use any video editing software that supports image sequences.\n")
+            
+            # Update status
+            self._status(f"Frames saved to: {frames_dir_name} (video creation failed)")
+            
+        except Exception as e:
+            print(f"Error saving frames with instructions: {e}")
+            self._status("Error saving video frames")
+
+# --- Recording Journal ---
+class RecordingJournal:
+    """Append-only JSON-lines log that lets an interrupted recording be finished later.
+
+    Lives in the session's temp directory next to the spilled frames. It
+    records the session parameters, every segment file opened and finished
+    (with its frame offset), and every frame spilled to disk. finish()
+    deletes it after a clean stop, so any journal found at startup belongs
+    to a session that never finished.
+    """
+    FILENAME = "journal.jsonl"
+
+    def __init__(self, session_dir):
+        os.makedirs(session_dir, exist_ok=True)
+        self.session_dir = session_dir
+        self.path = os.path.join(session_dir, self.FILENAME)
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a')
+
+    def append(self, event, sync=False, **fields):
+        """Write one event; sync also forces it to disk, for events that must survive a power cut"""
+        line = json.dumps(dict(fields, event=event, time=time.time()))
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line + "\n")
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def finish(self):
+        """Close and delete the journal after a clean stop"""
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.close()
+            self.file = None
+        try:
+            os.remove(self.path)
+            os.rmdir(self.session_dir)
+        except OSError:
+            pass
+
+    @staticmethod
+    def read(path):
+        """Return the events in a journal, ignoring a line cut short by a crash"""
+        events = []
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    break
+        return events
+
+def find_unfinished_sessions(temp_root):
+    """Session directories under temp_root that still hold a journal"""
+    if not os.path.isdir(temp_root):
+        return []
+    return [os.path.join(temp_root, name) for name in sorted(os.listdir(temp_root))
+            if os.path.exists(os.path.join(temp_root, name, RecordingJournal.FILENAME))]
+
+def count_video_frames(video_path):
+    """Number of frames OpenCV can read from a video file (0 if it is missing or unreadable)"""
+    if not os.path.exists(video_path) or os.path.getsize(video_path) == 0:
+        return 0
+    capture = cv2.VideoCapture(video_path)
+    try:
+        if not capture.isOpened():
+            return 0
+        frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frames <= 0:
+            # No usable index (e.g. the container was never finalized): count by decoding
+            while capture.grab():
+                frames += 1
+        return max(frames, 0)
+    finally:
+        capture.release()
+
+def recover_session(session_dir, capabilities=None):
+    """Finish a recording whose app exited mid-session, from its journal.
+
+    Segment files that were still being written are kept if they play and
+    added to the session's manifests; frames still spilled to disk are
+    encoded into a <session>_recovered video. The session directory is
+    removed afterwards. Returns the list of video files recovered.
+    """
+    events = RecordingJournal.read(os.path.join(session_dir, RecordingJournal.FILENAME))
+    session = next((e for e in events if e["event"] == "session"), None)
+    if session is None:
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return []
+    manifests = next((e for e in reversed(events) if e["event"] == "manifests"), None)
+    finished = {e["path"] for e in events if e["event"] == "segment_done"}
+    fps = session["fps"]
+    recovered = []
+
+    # Segments that were open when the app died (a segment may be journaled again with a corrected first_frame)
+    segments = {e["path"]: e for e in events if e["event"] == "segment"}
+    for event in sorted(segments.values(), key=lambda e: e["index"]):
+        path = event["path"]
+        if path in finished:
+            continue
+        frames = count_video_frames(path)
+        if frames == 0:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        if manifests:
+            append_to_manifests(manifests["playlist"], manifests["concat"], path, frames, fps)
+        recovered.append(path)
+
+    # Frames spilled to disk but never encoded, in capture order
+    spilled = {}
+    for event in events:
+        if event["event"] == "spill":
+            spilled[event["path"]] = [event["timestamp"], event["repeat"]]
+        elif event["event"] == "extend" and event["path"] in spilled:
+            spilled[event["path"]][1] = event["repeat"]
+    spilled = [(path, timestamp, repeat) for path, (timestamp, repeat) in spilled.items() if os.path.exists(path)]
+    if spilled:
+        if manifests:
+            session_name = os.path.splitext(os.path.basename(manifests["playlist"]))[0]
+        else:
+            session_name = f"screen_recording_{datetime.fromtimestamp(spilled[0][1]).strftime('%Y%m%d_%H%M%S')}"
+        video_path = os.path.join(session["save_dir"], f"{session_name}_recovered.mp4")
+        video_writer, video_path = open_video_writer(video_path, fps, (session["width"], session["height"]),
+                                                     session.get("encoder", "auto"),
+                                                     capabilities=capabilities, **session.get("encoder_options", {}))
+        frames = 0
+        for path, timestamp, repeat in spilled:
+            frame = np.load(path)
+            for _ in range(max(1, repeat)):
+                video_writer.write(frame)
+                frames += 1
+        video_writer.release()
+        if manifests:
+            append_to_manifests(manifests["playlist"], manifests["concat"], video_path, frames, fps, spilled[0][1],
+                                spilled[-1][1])
+        recovered.append(video_path)
+
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return recovered
+
+# --- Retention ---
+# Files the app creates in save_dir, by kind; nothing else there is ever deleted
+RETENTION_KINDS = {
+    "recordings": (("screen_recording_", "replay_"), (".mp4", ".avi", ".mov")),
+    "screenshots": (("screenshot_", "burst_"), (".png", ".jpg", ".jpeg", ".webp", ".bmp")),
+}
+
+def retention_kind(filename):
+    """Kind of an app-created file in save_dir, or None for anything else"""
+    name = filename.lower()
+    for kind, (prefixes, extensions) in RETENTION_KINDS.items():
+        if name.startswith(prefixes) and name.endswith(extensions):
+            return kind
+    return None
+
+class RetentionManager:
+    """Keeps save_dir within per-kind size, age and count limits and above a free-space floor.
+
+    The directory is scanned once; after that the app reports every file it
+    writes through add(), so the index and per-kind totals stay current
+    without rescanning. Eviction (oldest files first) runs on a background
+    thread whenever a file is added, and at least once a minute so age
+    limits apply to an idle app. Limits of 0 mean unlimited.
+    """
+    def __init__(self, save_dir, limits=None, min_free_mb=0):
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.limits = {}
+        self.min_free_bytes = 0
+        self.save_dir = None
+        self.index = {}  # path -> [kind, size, mtime]
+        self.totals = {kind: 0 for kind in RETENTION_KINDS}
+        self.configure(save_dir, limits, min_free_mb)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def configure(self, save_dir, limits=None, min_free_mb=0):
+        """Apply new limits ({kind: {"max_mb", "max_age_days", "max_files"}}); a new save_dir is rescanned"""
+        with self.lock:
+            self.limits = limits or {}
+            self.min_free_bytes = int(min_free_mb * 1024 * 1024)
+            if save_dir != self.save_dir:
+                self.save_dir = save_dir
+                self.index = {}
+                self.totals = {kind: 0 for kind in RETENTION_KINDS}
+                try:
+                    entries = list(os.scandir(save_dir))
+                except OSError:
+                    entries = []
+                for entry in entries:
+                    kind = retention_kind(entry.name)
+                    if kind and entry.is_file():
+                        stat = entry.stat()
+                        self.index[entry.path] = [kind, stat.st_size, stat.st_mtime]
+                        self.totals[kind] += stat.st_size
+        self.wake.set()
+
+    def add(self, path):
+        """Record a file the app just finished writing"""
+        kind = retention_kind(os.path.basename(path))
+        if kind is None or os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.save_dir):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self.lock:
+            old = self.index.get(path)
+            if old:
+                self.totals[old[0]] -= old[1]
+            self.index[path] = [kind, stat.st_size, stat.st_mtime]
+            self.totals[kind] += stat.st_size
+        self.wake.set()
+
+    def files(self):
+        """Indexed files as [(path, mtime, size)], newest first"""
+        with self.lock:
+            files = [(path, mtime, size) for path, (kind, size, mtime) in self.index.items()]
+        files.sort(key=lambda item: item[1], reverse=True)
+        return files
+
+    def usage(self):
+        """Return {kind: (file count, total bytes)}"""
+        with self.lock:
+            counts = {kind: 0 for kind in RETENTION_KINDS}
+            for kind, _, _ in self.index.values():
+                counts[kind] += 1
+            return {kind: (counts[kind], self.totals[kind]) for kind in RETENTION_KINDS}
+
+    def free_bytes(self):
+        try:
+            return shutil.disk_usage(self.save_dir).free
+        except OSError:
+            return None
+
+    def ensure_free_space(self):
+        """Evict the oldest files until the free-space floor is met; returns False if it can't be"""
+        while True:
+            free = self.free_bytes()
+            if free is None or free >= self.min_free_bytes:
+                return True
+            with self.lock:
+                oldest = min(self.index, key=lambda path: self.index[path][2], default=None)
+            if oldest is None:
+                return False
+            self._evict(oldest, "low disk space")
+
+    def _run(self):
+        while True:
+            self.wake.wait(timeout=60)
+            self.wake.clear()
+            try:
+                self._enforce_limits()
+                self.ensure_free_space()
+            except Exception as e:
+                print(f"Retention check failed: {e}")
+
+    def _enforce_limits(self):
+        now = time.time()
+        for kind in RETENTION_KINDS:
+            limits = self.limits.get(kind, {})
+            max_bytes = int(limits.get("max_mb", 0) * 1024 * 1024)
+            max_age = limits.get("max_age_days", 0) * 86400
+            max_files = limits.get("max_files", 0)
+            if not (max_bytes or max_age or max_files):
+                continue
+            with self.lock:
+                files = sorted((mtime, path, size) for path, (file_kind, size, mtime) in self.index.items()
+                               if file_kind == kind)
+            total = sum(size for _, _, size in files)
+            count = len(files)
+            for mtime, path, size in files:
+                if not ((max_bytes and total > max_bytes) or (max_age and now - mtime > max_age)
+                        or (max_files and count > max_files)):
+                    break
+                self._evict(path, f"{kind} retention")
+                total -= size
+                count -= 1
+
+    def _evict(self, path, reason):
+        try:
+            os.remove(path)
+            print(f"Deleted {os.path.basename(path)} ({reason})")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not delete {path}: {e}")
+        with self.lock:
+            entry = self.index.pop(path, None)
+            if entry:
+                self.totals[entry[0]] -= entry[1]
+
+# --- Replay Buffer ---
+class ReplayBuffer:
+    """Circular in-memory store of JPEG-compressed frames covering the last N seconds.
+
+    An entry stands for repeat video frames starting at its timestamp, so
+    it covers timestamp + repeat / fps. Entries older than the time window
+    are evicted, and the oldest one is shortened (not dropped) when it only
+    partly falls outside, so an unchanged screen still yields exactly the
+    last N seconds. Entries are also evicted past the memory cap. Nothing
+    is written to disk until a replay is saved.
+    """
+    def __init__(self, duration_seconds, max_memory_mb, quality=80, fps=24):
+        self.duration_seconds = duration_seconds
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self.quality = quality
+        self.fps = fps
+        self.entries = deque()  # [timestamp, jpeg_bytes, repeat], oldest first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def add(self, frame, timestamp, repeat=1):
+        """Compress a BGR frame and append it, evicting what no longer fits"""
+        ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise Exception("JPEG encoding failed")
+        data = data.tobytes()
+        with self.lock:
+            self.entries.append([timestamp, data, repeat])
+            self.total_bytes += len(data)
+            self.total_bytes -= self._trim(self.entries)
+            # Always keep the newest frame, even if it alone is over the cap
+            while len(self.entries) > 1 and self.total_bytes > self.max_bytes:
+                self.total_bytes -= len(self.entries.popleft()[1])
+
+    def extend_last(self, repeat):
+        """Count an unchanged capture against the newest frame instead of storing it again"""
+        with self.lock:
+            if not self.entries:
+                return False
+            self.entries[-1][2] += repeat
+            self.total_bytes -= self._trim(self.entries)
+            return True
+
+    def snapshot(self):
+        """Return a copy of the current entries, trimmed to the window, for encoding; the store keeps recording"""
+        with self.lock:
+            entries = deque(list(entry) for entry in self.entries)
+        self._trim(entries)
+        return list(entries)
+
+    def _trim(self, entries):
+        """Cut entries down to the duration_seconds before the end of the newest one; returns bytes freed"""
+        if not entries:
+            return 0
+        newest = entries[-1]
+        cutoff = newest[0] + newest[2] / self.fps - self.duration_seconds
+        freed = 0
+        while entries:
+            timestamp, data, repeat = entries[0]
+            if len(entries) > 1 and timestamp + repeat / self.fps <= cutoff:
+                freed += len(entries.popleft()[1])
+                continue
+            # Partly outside the window: drop just its leading frames, always keeping one
+            skip = min(repeat - 1, int((cutoff - timestamp) * self.fps + 1e-6))
+            if skip > 0:
+                entries[0][0] += skip / self.fps
+                entries[0][2] -= skip
+            break
+        return freed
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+# --- Background Saving ---
+IMAGE_FORMATS = ["PNG", "JPG", "WEBP"]
+# PIL format names for the format choices shown in the UI
+PIL_FORMATS = {"JPG": "JPEG"}
+
+# Encoder options per profile and format, passed straight to Image.save
+IMAGE_PROFILES = {
+    "fast": {  # Burst capture: cheapest encode, larger files
+        "PNG": {"compress_level": 1},
+        "JPG": {"quality": 85},
+        "WEBP": {"lossless": True, "quality": 0, "method": 0},
+    },
+    "balanced": {
+        "PNG": {"compress_level": 3},
+        "JPG": {"quality": 90},
+        "WEBP": {"quality": 90, "method": 4},
+    },
+    "small": {  # Archival: smallest files; JPG and WEBP are lossy here
+        "PNG": {"compress_level": 9, "optimize": True},
+        "JPG": {"quality": 80, "optimize": True, "progressive": True},
+        # Lossless method 5 was ~7x slower than method 4 for no size gain; lossy
+        # q75 is smaller still on screenshots with photos or gradients
+        "WEBP": {"quality": 75, "method": 4},
+    },
+    "lossless": {  # Except JPG, which has no lossless mode
+        "PNG": {"compress_level": 6},
+        "JPG": {"quality": 100, "subsampling": 0},  # Near-lossless at best: still lossy
+        "WEBP": {"lossless": True, "quality": 50, "method": 4},
+    },
+}
+
+def image_save_params(profile, image_format):
+    """Image.save keyword arguments for an encoding profile and format"""
+    formats = IMAGE_PROFILES.get(profile, IMAGE_PROFILES["balanced"])
+    return dict(formats.get(image_format.upper(), {}))
+
+class ImageBufferPool:
+    """Fixed set of RGB frame buffers recycled between captures and the writer.
+
+    A capture loop takes a buffer, fills it and hands the image to the
+    writer, which gives the buffer back once the file is written, so
+    memory stays at count frames however long the loop runs.
+    """
+    def __init__(self, count):
+        self.free = queue.Queue()
+        for _ in range(count):
+            self.free.put(None)  # Allocated on first use, once the frame size is known
+
+    def acquire(self, shape, timeout=None):
+        """Return a uint8 buffer of shape, or None if none came free within timeout"""
+        try:
+            buffer = self.free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    def release(self, buffer):
+        self.free.put(buffer)
+
+class BackgroundImageWriter:
+    """Pool of worker threads that save still images from a bounded queue.
+
+    Each image is written to a temporary file in the target directory and
+    renamed into place, so a crash or full disk never leaves a truncated
+    image under the final name.
+    """
+    def __init__(self, workers=2, max_pending=8):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, image, path, image_format, params=None, callback=None, timeout=0):
+        """Queue an image for saving, waiting up to timeout for room.
+
+        callback(path, error) runs on a worker thread once the file is in
+        place (error is None) or the save failed. Returns False if the queue
+        stayed full.
+        """
+        try:
+            self.queue.put((image, path, image_format, params or {}, callback),
+                           block=timeout > 0, timeout=timeout or None)
+            return True
+        except queue.Full:
+            return False
+
+    def pending(self):
+        return self.queue.unfinished_tasks
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                break
+            image, path, image_format, params, callback = job
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            error = None
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(temp_path, 'wb') as f:
+                    image.save(f, PIL_FORMATS.get(image_format.upper(), image_format.upper()), **params)
+                os.replace(temp_path, path)
+            except Exception as e:
+                error = e
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            finally:
+                self.queue.task_done()
+            if callback:
+                try:
+                    callback(path, error)
+                except Exception as e:
+                    print(f"Save callback failed: {e}")
+
+    def flush(self, timeout=None):
+        """Wait until every queued image has been written; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+# --- Clipboard Export ---
+class Clipboard:
+    """Base class for clipboards that take an image already encoded in their format"""
+    name = "base"
+    format = "PNG"  # PIL format the bytes handed to copy() must be in
+
+    def copy(self, data):
+        """Replace the clipboard contents with the encoded image data"""
+        raise NotImplementedError
+
+class MemoryClipboard(Clipboard):
+    """Keeps the copied image in memory; for tests and headless runs"""
+    name = "memory"
+
+    def __init__(self, image_format="PNG"):
+        self.format = image_format
+        self.data = None
+        self.copies = 0
+
+    def copy(self, data):
+        self.data = bytes(data)
+        self.copies += 1
+
+    def image(self):
+        """The copied image decoded again, or None"""
+        return Image.open(io.BytesIO(self.data)) if self.data is not None else None
+
+class CommandClipboard(Clipboard):
+    """Pipes PNG bytes to a clipboard tool (xclip or wl-copy)"""
+    def __init__(self, name, command):
+        self.name = name
+        self.command = command
+
+    def copy(self, data):
+        # Both tools fork to keep serving the selection; no output pipes, so
+        # the forked child can't keep run() waiting
+        subprocess.run(self.command, input=data, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True, timeout=10)
+
+class MacClipboard(Clipboard):
+    """Sets the clipboard to PNG data through AppleScript"""
+    name = "macos"
+
+    def copy(self, data):
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+            f.write(data)
+        try:
+            script = f'set the clipboard to (read (POSIX file "{f.name}") as «class PNGf»)'
+            subprocess.run(["osascript", "-e", script], capture_output=True, check=True, timeout=10)
+        finally:
+            os.remove(f.name)
+
+class WindowsClipboard(Clipboard):
+    """Sets the clipboard to a CF_DIB bitmap through the Win32 API"""
+    name = "windows"
+    format = "BMP"
+
+    def copy(self, data):
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        user32 = ctypes.windll.user32
+        kernel32.GlobalAlloc.restype = ctypes.c_void_p
+        kernel32.GlobalLock.restype = ctypes.c_void_p
+        kernel32.GlobalLock.argtypes = [ctypes.c_void_p]
+        kernel32.GlobalUnlock.argtypes = [ctypes.c_void_p]
+        kernel32.GlobalFree.argtypes = [ctypes.c_void_p]
+        user32.SetClipboardData.argtypes = [ctypes.c_uint, ctypes.c_void_p]
+        user32.SetClipboardData.restype = ctypes.c_void_p
+
+        dib = memoryview(data)[14:]  # CF_DIB is a BMP file without its 14-byte file header
+        handle = kernel32.GlobalAlloc(0x0002, len(dib))  # GMEM_MOVEABLE
+        if not handle:
+            raise OSError("Could not allocate clipboard memory")
+        ctypes.memmove(kernel32.GlobalLock(handle), bytes(dib), len(dib))
+        kernel32.GlobalUnlock(handle)
+        if not user32.OpenClipboard(None):
+            kernel32.GlobalFree(handle)
+            raise OSError("Clipboard is in use by another application")
+        try:
+            user32.EmptyClipboard()
+            if not user32.SetClipboardData(8, handle):  # CF_DIB; the clipboard owns handle from here
+                kernel32.GlobalFree(handle)
+                raise OSError("Could not set clipboard data")
+        finally:
+            user32.CloseClipboard()
+
+def create_clipboard(name="auto"):
+    """Create the platform's clipboard, or the in-memory one for "memory\""""
+    if name == "memory":
+        return MemoryClipboard()
+    if sys.platform == "win32":
+        return WindowsClipboard()
+    if sys.platform == "darwin":
+        return MacClipboard()
+    if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wl-copy"):
+        return CommandClipboard("wl-copy", ["wl-copy", "--type", "image/png"])
+    if shutil.which("xclip"):
+        return CommandClipboard("xclip", ["xclip", "-selection", "clipboard", "-t", "image/png", "-i"])
+    raise RuntimeError("No clipboard tool found - install xclip (X11) or wl-clipboard (Wayland)")
+
+class ClipboardExporter:
+    """Encodes images for a Clipboard and copies them on a worker thread.
+
+    The last encoding is kept, so copying the same image again skips the
+    encode. Only the newest request matters: one queued while a copy is in
+    flight replaces any earlier queued request, whose callback never runs.
+    """
+    SAVE_PARAMS = {"PNG": {"compress_level": 1}}  # Clipboard data is short-lived; favour speed
+
+    def __init__(self, clipboard):
+        self.clipboard = clipboard
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pending = None  # (image, callback) for the worker
+        self.encoded = (None, None)  # (image, data) of the last encode
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def copy(self, image, callback=None):
+        """Queue image for the clipboard; callback(error) runs on the worker when done"""
+        with self.lock:
+            self.pending = (image, callback)
+        self.wake.set()
+
+    def encode(self, image):
+        """Image bytes in the clipboard's format, reusing the last encode of the same image"""
+        cached_image, data = self.encoded
+        if cached_image is not image:
+            out = io.BytesIO()
+            image_format = self.clipboard.format
+            image.save(out, image_format, **self.SAVE_PARAMS.get(image_format, {}))
+            data = out.getvalue()
+            self.encoded = (image, data)
+        return data
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+            with self.lock:
+                job, self.pending = self.pending, None
+                self.wake.clear()
+            if job is None:
+                continue
+            image, callback = job
+            try:
+                self.clipboard.copy(self.encode(image))
+                error = None
+            except Exception as e:
+                error = e
+            if callback:
+                callback(error)
+
+# --- Region Selection ---
+class RegionSelector:
+    """Full-screen translucent overlay for dragging out a capture rectangle.
+
+    on_done(region) receives (left, top, width, height) in capture backend
+    pixels, or None if the selection was cancelled with Escape or a click
+    without a drag. screen_size is the backend's screen size, used to map
+    Tk's (possibly DPI-scaled) coordinates onto real pixels.
+    """
+    MIN_SIZE = 8
+
+    def __init__(self, root, screen_size, on_done):
+        self.on_done = on_done
+        self.start = None  # Press position in screen coordinates
+        self.anchor = None  # Press position on the canvas
+        self.rect = None
+
+        self.window = tk.Toplevel(root)
+        self.window.attributes('-fullscreen', True)
+        self.window.attributes('-topmost', True)
+        self.window.attributes('-alpha', 0.3)
+        self.window.configure(cursor='crosshair')
+        self.canvas = tk.Canvas(self.window, bg='black', highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+
+        self.window.update_idletasks()
+        self.scale_x = screen_size[0] / self.window.winfo_screenwidth()
+        self.scale_y = screen_size[1] / self.window.winfo_screenheight()
+
+        self.canvas.bind('<ButtonPress-1>', self._on_press)
+        self.canvas.bind('<B1-Motion>', self._on_drag)
+        self.canvas.bind('<ButtonRelease-1>', self._on_release)
+        self.window.bind('<Escape>', lambda event: self._finish(None))
+        self.window.focus_force()
+
+    def _on_press(self, event):
+        self.start = (event.x_root, event.y_root)
+        self.anchor = (event.x, event.y)
+        self.rect = self.canvas.create_rectangle(event.x, event.y, event.x, event.y,
+                                                 outline='red', width=2, fill='white')
+
+    def _on_drag(self, event):
+        if self.rect is not None:
+            self.canvas.coords(self.rect, *self.anchor, event.x, event.y)
+
+    def _on_release(self, event):
+        if self.start is None:
+            return
+        left, right = sorted((self.start[0], event.x_root))
+        top, bottom = sorted((self.start[1], event.y_root))
+        region = (int(round(left * self.scale_x)), int(round(top * self.scale_y)),
+                  int(round((right - left) * self.scale_x)), int(round((bottom - top) * self.scale_y)))
+        if region[2] < self.MIN_SIZE or region[3] < self.MIN_SIZE:
+            region = None
+        self._finish(region)
+
+    def _finish(self, region):
+        self.window.destroy()
+        self.on_done(region)
+
+# --- Thumbnail Cache ---
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov")
+
+class ThumbnailCache:
+    """On-disk cache of capture thumbnails, rendered lazily on a worker pool.
+
+    Entries are keyed by source path, mtime and size, so an edited or
+    replaced file gets a fresh thumbnail. The least recently used
+    thumbnails are deleted once the cache grows past max_mb.
+    """
+    def __init__(self, cache_dir, size=(160, 90), max_mb=64, workers=2):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_bytes = max_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> thumbnail file size, least recently used first
+        self.total_bytes = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        cached = []
+        for entry in os.scandir(cache_dir):
+            if entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                cached.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, file_size in sorted(cached):
+            self.entries[key] = file_size
+            self.total_bytes += file_size
+
+    def _key(self, path, mtime, size):
+        return hashlib.sha1(f"{os.path.abspath(path)}|{mtime}|{size}|{self.size}".encode()).hexdigest()
+
+    def request(self, path, mtime, size, callback):
+        """Load or render path's thumbnail on a worker; callback(path, image or None) runs there.
+
+        Returns the Future, which callers may cancel if the thumbnail is no
+        longer needed before a worker picks it up.
+        """
+        return self.executor.submit(self._load, path, mtime, size, callback)
+
+    def _load(self, path, mtime, size, callback):
+        key = self._key(path, mtime, size)
+        thumb_path = os.path.join(self.cache_dir, f"{key}.jpg")
+        image = None
+        with self.lock:
+            cached = key in self.entries
+            if cached:
+                self.entries.move_to_end(key)
+        if cached:
+            try:
+                image = Image.open(thumb_path)
+                image.load()
+                os.utime(thumb_path)  # Keeps LRU order across restarts
+            except OSError:
+                image = None
+        if image is None:
+            try:
+                image = self._render(path)
+                temp_path = f"{thumb_path}.{threading.get_ident()}.tmp"
+                image.save(temp_path, "JPEG", quality=85)
+                os.replace(temp_path, thumb_path)
+                self._added(key, os.path.getsize(thumb_path))
+            except Exception as e:
+                print(f"Thumbnail failed for {path}: {e}")
+                image = None
+        callback(path, image)
+
+    def _render(self, path):
+        if path.lower().endswith(VIDEO_EXTENSIONS):
+            capture = cv2.VideoCapture(path)
+            try:
+                ok, frame = capture.read()
+            finally:
+                capture.release()
+            if not ok:
+                raise OSError("no readable frames")
+            image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        else:
+            image = Image.open(path)
+            image.draft("RGB", self.size)  # JPEGs decode straight at a reduced scale
+            image = image.convert("RGB")
+        image.thumbnail(self.size, Image.BILINEAR, reducing_gap=2.0)
+        return image
+
+    def _added(self, key, file_size):
+        """Account for a new thumbnail and delete the least recently used ones past the budget"""
+        evicted = []
+        with self.lock:
+            self.total_bytes += file_size - self.entries.pop(key, 0)
+            self.entries[key] = file_size
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, f"{old_key}.jpg"))
+            except OSError:
+                pass
+
+# --- Perceptual Hashing ---
+def dhash(image, hash_size=8):
+    """64-bit difference hash of an image array (BGR or RGB) or PIL image"""
+    # Box-average down by a whole factor first: INTER_AREA straight to 9x8 is
+    # ~40 ms on a 4K frame, this is ~8 ms and hashes the same within a bit or two
+    if isinstance(image, Image.Image):
+        step = max(1, min(image.size) // (hash_size * 16))
+        pixels = np.asarray(image.reduce(step) if step > 1 else image)
+    else:
+        pixels = np.asarray(image)
+        step = max(1, min(pixels.shape[:2]) // (hash_size * 16))
+        if step > 1:
+            pixels = cv2.resize(pixels, (pixels.shape[1] // step, pixels.shape[0] // step),
+                                interpolation=cv2.INTER_AREA)
+    small = cv2.resize(pixels, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = small.mean(axis=2)  # Channel order doesn't change the hash
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def video_keyframe_hashes(video_path, every_seconds=5):
+    """dHashes of the first frame of a video and one every every_seconds after it"""
+    capture = cv2.VideoCapture(video_path)
+    try:
+        step = max(1, round((capture.get(cv2.CAP_PROP_FPS) or 24) * every_seconds))
+        hashes = []
+        index = 0
+        while True:
+            if index % step == 0:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                hashes.append(dhash(frame))
+            elif not capture.grab():  # Skips without converting the frame
+                break
+            index += 1
+        return hashes
+    finally:
+        capture.release()
+
+class BKTree:
+    """Burkhard-Keller tree answering Hamming-distance range queries over hashes"""
+    def __init__(self):
+        self.root = None  # [hash, items, {distance: child node}]
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Return [(distance, item)] for every item within max_distance of value"""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                results.extend((distance, item) for item in items)
+            # Triangle inequality: only these subtrees can hold matches
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return results
+
+class HashIndex:
+    """Perceptual hashes of the screenshots and video keyframes in save_dir.
+
+    Hashes are held in a BK-tree for similarity queries and appended to a
+    compact binary file in save_dir (a 10-byte record header plus the
+    filename), so each capture is hashed only once. Records of deleted
+    files are dropped when the index is loaded, and captures saved before
+    the index existed are hashed then. All updates run on one background
+    thread, in order.
+    """
+    FILENAME = "capture_hashes.bin"
+    RECORD = struct.Struct("<QH")  # hash, filename length
+
+    def __init__(self, save_dir, keyframe_seconds=5):
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.keyframe_seconds = keyframe_seconds
+        self.save_dir = None
+        self.tree = BKTree()
+        self.names = set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.configure(save_dir)
+
+    def configure(self, save_dir):
+        """Switch to save_dir's index, hashing any captures missing from it"""
+        if save_dir != self.save_dir:
+            self.jobs.put(("load", save_dir))
+
+    def add(self, path, value):
+        """Record the hash of a capture the app just saved"""
+        self.jobs.put(("add", path, value))
+
+    def add_file(self, path):
+        """Hash a saved screenshot or a video's keyframes in the background"""
+        self.jobs.put(("file", path))
+
+    def similar(self, value, max_distance=10):
+        """Captures within max_distance bits of value as [(distance, path)], closest first"""
+        with self.lock:
+            matches = self.tree.search(value, max_distance)
+            save_dir = self.save_dir
+        best = {}
+        for distance, name in matches:
+            best[name] = min(distance, best.get(name, distance))
+        results = [(distance, os.path.join(save_dir, name)) for name, distance in best.items()]
+        return sorted(result for result in results if os.path.exists(result[1]))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job[0] == "load":
+                    self._load(job[1])
+                elif job[0] == "add":
+                    self._append(job[1], [job[2]])
+                elif job[0] == "file":
+                    self._append(job[1], self._hash_file(job[1]))
+            except Exception as e:
+                print(f"Hash index update failed: {e}")
+
+    def _hash_file(self, path):
+        if path.lower().endswith(VIDEO_EXTENSIONS):
+            return video_keyframe_hashes(path, self.keyframe_seconds)
+        with Image.open(path) as image:
+            image.draft("RGB", (64, 64))  # JPEGs decode straight at a reduced scale
+            return [dhash(image.convert("RGB"))]
+
+    def _append(self, path, values):
+        if not values or os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.save_dir):
+            return
+        name = os.path.basename(path)
+        encoded = name.encode("utf-8")
+        with open(os.path.join(self.save_dir, self.FILENAME), 'ab') as f:
+            f.write(b"".join(self.RECORD.pack(value, len(encoded)) + encoded for value in values))
+        with self.lock:
+            for value in values:
+                self.tree.add(value, name)
+            self.names.add(name)
+
+    def _load(self, save_dir):
+        index_path = os.path.join(save_dir, self.FILENAME)
         try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    data = json.load(f)
-                    self.save_format = data.get('save_format', self.save_format)
-                    self.video_format = data.get('video_format', self.video_format)
-                    self.save_dir = data.get('save_dir', self.save_dir)
-                    self.video_duration_seconds = data.get('video_duration_seconds', self.video_duration_seconds)
-                    self.fps = data.get('fps', self.fps)
-                    self.clip_duration_seconds = data.get('clip_duration_seconds', self.clip_duration_seconds)
-                    self.resolution_width = data.get('resolution_width', self.resolution_width)
-                    self.resolution_height = data.get('resolution_height', self.resolution_height)
-                    self.resolution_preset = data.get('resolution_preset', self.resolution_preset)
-        except Exception as e:
-            print(f"Error loading settings: {e}")
-    
-    def save_settings(self):
+            with open(index_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            data = b""
         try:
-            data = {
-                'save_format': self.save_format,
-                'video_format': self.video_format,
-                'save_dir': self.save_dir,
-                'video_duration_seconds': self.video_duration_seconds,
-                'fps': self.fps,
-                'clip_duration_seconds': self.clip_duration_seconds,
-                'resolution_width': self.resolution_width,
-                'resolution_height': self.resolution_height,
-                'resolution_preset': self.resolution_preset
-            }
-            with open(self.config_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except Exception as e:
-            print(f"Error saving settings: {e}")
-    
-    def set_resolution_preset(self, preset):
-        """Set resolution based on preset"""
-        presets = {
-            "480p": (854, 480),
-            "720p": (1280, 720),
-            "1080p": (1920, 1080),
-            "1440p": (2560, 1440),
-            "4K": (3840, 2160)
-        }
-        if preset in presets:
-            self.resolution_width, self.resolution_height = presets[preset]
-            self.resolution_preset = preset
+            existing = {entry.name for entry in os.scandir(save_dir) if entry.is_file()}
+        except OSError:
+            existing = set()
+
+        tree, names, kept = BKTree(), set(), []
+        offset = 0
+        while offset + self.RECORD.size <= len(data):
+            value, length = self.RECORD.unpack_from(data, offset)
+            end = offset + self.RECORD.size + length
+            if end > len(data):
+                break  # Torn last record
+            name = data[offset + self.RECORD.size:end].decode("utf-8", "replace")
+            if name in existing:
+                tree.add(value, name)
+                names.add(name)
+                kept.append(data[offset:end])
+            offset = end
+        if sum(map(len, kept)) != len(data):
+            # Compact away deleted captures (and any torn record)
+            temp_path = f"{index_path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(b"".join(kept))
+            os.replace(temp_path, index_path)
+
+        with self.lock:
+            self.save_dir, self.tree, self.names = save_dir, tree, names
+        for name in sorted(existing - names):
+            if retention_kind(name):
+                self.add_file(os.path.join(save_dir, name))
+
+# --- History Gallery ---
+class HistoryGallery:
+    """Scrollable grid of saved captures, newest first.
+
+    Only the rows in view (plus one row either side) have canvas items and
+    thumbnails; rows scrolled away are dropped and their pending thumbnail
+    requests cancelled, so a folder of thousands of captures opens at once.
+    """
+    COLUMNS = 3
+    CELL_WIDTH = 176
+    CELL_HEIGHT = 124
+
+    def __init__(self, root, files, cache, ui, on_open, title="Capture History"):
+        self.files = files  # [(path, mtime, size)], newest first
+        self.cache = cache
+        self.ui = ui
+        self.on_open = on_open
+        self.cells = {}  # index -> canvas item ids
+        self.photos = {}  # index -> PhotoImage, kept referenced while drawn
+        self.pending = {}  # index -> Future for a thumbnail not yet delivered
+        self.refresh_scheduled = False
+        self.closed = False
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"{title} ({len(files)})")
+        self.window.geometry(f"{self.COLUMNS * self.CELL_WIDTH + 30}x600")
+        self.canvas = tk.Canvas(self.window, bg='white', highlightthickness=0)
+        scrollbar = ttk.Scrollbar(self.window, orient=tk.VERTICAL, command=self.canvas.yview)
+
+        def on_view_change(first, last):
+            scrollbar.set(first, last)
+            self._schedule_refresh()
+
+        self.canvas.configure(yscrollcommand=on_view_change, yscrollincrement=self.CELL_HEIGHT // 2,
+                              scrollregion=(0, 0, self.COLUMNS * self.CELL_WIDTH,
+                                            math.ceil(len(files) / self.COLUMNS) * self.CELL_HEIGHT))
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind('<Configure>', lambda event: self._schedule_refresh())
+        self.canvas.bind('<MouseWheel>', lambda event: self.canvas.yview_scroll(-1 if event.delta > 0 else 1, 'units'))
+        self.canvas.bind('<Button-4>', lambda event: self.canvas.yview_scroll(-1, 'units'))
+        self.canvas.bind('<Button-5>', lambda event: self.canvas.yview_scroll(1, 'units'))
+        self.canvas.bind('<Double-Button-1>', self._on_double_click)
+        self.window.bind('<Destroy>', self._on_destroy)
+
+        if not files:
+            self.canvas.create_text(20, 20, text="No captures yet", anchor=tk.NW)
+
+    def _schedule_refresh(self):
+        # Coalesce the burst of view changes a drag or wheel produces into one redraw
+        if not self.refresh_scheduled:
+            self.refresh_scheduled = True
+            self.window.after_idle(self._refresh)
+
+    def _refresh(self):
+        self.refresh_scheduled = False
+        top = self.canvas.canvasy(0)
+        first_row = max(0, int(top // self.CELL_HEIGHT) - 1)
+        last_row = int((top + self.canvas.winfo_height()) // self.CELL_HEIGHT) + 1
+        visible = set(range(first_row * self.COLUMNS, min(len(self.files), (last_row + 1) * self.COLUMNS)))
+
+        for index in [index for index in self.cells if index not in visible]:
+            for item in self.cells.pop(index):
+                self.canvas.delete(item)
+            self.photos.pop(index, None)
+            future = self.pending.pop(index, None)
+            if future:
+                future.cancel()
+        for index in sorted(visible - self.cells.keys()):
+            self._draw_cell(index)
+
+    def _cell_origin(self, index):
+        row, column = divmod(index, self.COLUMNS)
+        return column * self.CELL_WIDTH, row * self.CELL_HEIGHT
+
+    def _draw_cell(self, index):
+        path, mtime, size = self.files[index]
+        x, y = self._cell_origin(index)
+        width, height = self.cache.size
+        name = os.path.basename(path)
+        if len(name) > 26:
+            name = name[:12] + "..." + name[-11:]
+        self.cells[index] = [
+            self.canvas.create_rectangle(x + 8, y + 4, x + 8 + width, y + 4 + height, outline='#ccc', fill='#eee'),
+            self.canvas.create_text(x + 8, y + height + 8, text=name, anchor=tk.NW, font=('Arial', 7)),
+        ]
+        self.pending[index] = self.cache.request(
+            path, mtime, size, lambda path, image, index=index: self.ui.call(self._show_thumbnail, index, path, image))
+
+    def _show_thumbnail(self, index, path, image):
+        """Place a delivered thumbnail (Tk thread), unless its row has scrolled away meanwhile"""
+        self.pending.pop(index, None)
+        if self.closed or image is None or index not in self.cells or self.files[index][0] != path:
+            return
+        x, y = self._cell_origin(index)
+        width, height = self.cache.size
+        photo = ImageTk.PhotoImage(image)
+        self.photos[index] = photo
+        self.cells[index].append(self.canvas.create_image(x + 8 + width // 2, y + 4 + height // 2, image=photo))
+
+    def _on_double_click(self, event):
+        column = int(self.canvas.canvasx(event.x) // self.CELL_WIDTH)
+        row = int(self.canvas.canvasy(event.y) // self.CELL_HEIGHT)
+        index = row * self.COLUMNS + column
+        if column < self.COLUMNS and 0 <= index < len(self.files):
+            self.on_open(self.files[index][0])
+
+    def _on_destroy(self, event):
+        if event.widget is self.window:
+            self.closed = True
+            for future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+            self.photos.clear()
+
+# --- UI Bridge ---
+class UiBridge:
+    """Hands UI updates from worker threads to the Tk thread.
+
+    Tk isn't thread-safe, so workers never touch widgets or variables
+    directly: call() queues a function to run on the Tk thread, and set()
+    records the newest value for a Tk variable, so a burst of progress
+    updates collapses into one. Both return immediately. The Tk loop drains
+    everything every interval_ms, running at most max_batch queued calls
+    per pass.
+    """
+    def __init__(self, root, interval_ms=50, max_batch=100):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.max_batch = max_batch
+        self.calls = queue.SimpleQueue()
+        self.latest = {}  # Tk variable -> newest value, applied once per drain
+        self.lock = threading.Lock()
+        self.root.after(self.interval_ms, self._drain)
+
+    def call(self, func, *args):
+        """Run func(*args) on the Tk thread"""
+        self.calls.put((func, args))
+
+    def set(self, variable, value):
+        """Set a Tk variable from any thread; only the newest pending value is applied"""
+        with self.lock:
+            self.latest[variable] = value
+
+    def _drain(self):
+        with self.lock:
+            latest, self.latest = self.latest, {}
+        for variable, value in latest.items():
+            variable.set(value)
+        for _ in range(self.max_batch):
+            try:
+                func, args = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"UI update failed: {e}")
+        self.root.after(self.interval_ms, self._drain)
 
 # --- Main App ---
+# Settings a running recording picks up; the rest apply from the next recording
+LIVE_RECORDING_SETTINGS = ("video_resize_filter", "metrics_log", "clip_duration_seconds")
+
 class ScreenCaptureApp:
     def __init__(self, root):
         self.root = root
@@ -92,10 +2456,24 @@ class ScreenCaptureApp:
         self.root.geometry(f"500x800+{x}+{y}")
         
         self.settings = Settings()
+        
+        # Find working video encoders once, off the UI thread (started by _warm_up)
+        self.encoder_probe = EncoderProbe(self.settings.encoder_cache_file)
         self.last_image = None
         self.last_image_path = None
         self.last_video_path = None
         self.preview_imgtk = None
+        self.capture_backend = None  # Created lazily from settings.capture_backend
+        self.image_writer = BackgroundImageWriter()  # Saves stills off the UI thread
+        self.ui = UiBridge(root)  # Worker threads post UI updates through this
+        self.retention = RetentionManager(self.settings.save_dir, self.settings.retention_limits(),
+                                          self.settings.min_free_disk_mb)
+        self.thumbnail_cache = None  # Created when the history gallery is first opened
+        self.clipboard_exporter = None  # Created on first copy
+        self.hash_index = HashIndex(self.settings.save_dir)  # Perceptual hashes for dedup and similarity search
+        self.last_saved_hash = None  # dHash of the last capture queued for saving
+        self.still_resizer = FrameResizer(self.settings.resolution_width, self.settings.resolution_height,
+                                          self.settings.still_resize_filter)
         self.recording_start_time = None
         
         # Video recording attributes
@@ -105,9 +2483,28 @@ class ScreenCaptureApp:
         self.frames_per_second = self.settings.fps  # Use FPS from settings
         self.clip_duration_seconds = self.settings.clip_duration_seconds  # Use clip duration from settings
         self.video_duration_seconds = self.settings.video_duration_seconds
-        self.captured_frames = []
-        self.current_video_start_time = None
-        self.video_segments_created = 0  # Track number of video segments created
+        self.frames_dropped = 0
+        self.frames_unchanged = 0  # Frames the change detector found identical to the previous one
+        self.changed_tiles = None  # Tile mask of the last captured frame
+        self.frame_buffer = None  # FrameRingBuffer joining the capture and encoder stages
+        self.segment_encoder = None
+        self.frame_scheduler = None
+        self.segments_created = 0  # Track number of video segments created
+        self.recording_region_source = None  # Callable giving the rectangle to grab; None records the full screen
+        self.recording_output_size = None
+        self.metrics = None  # PipelineMetrics of the current recording
+        self.recording_changes = queue.SimpleQueue()  # Settings changes for the capture thread to apply
+        
+        # Instant replay attributes
+        self.replay_active = False
+        self.replay_fps = self.frames_per_second  # Fixed while the replay buffer runs
+        self.replay_buffer = None
+        self.replay_thread = None
+        self.replay_hotkey = None  # pynput listener for F9 in other apps (optional dependency)
+        
+        # Burst capture attributes
+        self.burst_stop = threading.Event()
+        self.burst_thread = None
 
         style = ttk.Style()
         style.theme_use('clam')
@@ -135,6 +2532,22 @@ class ScreenCaptureApp:
         status_bar = ttk.Label(main_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
         status_bar.pack(fill=tk.X, pady=(10, 0))
 
+        # Finish recordings left behind by a crash, off the UI thread. The list is
+        # taken now so a recording started meanwhile is never mistaken for one
+        unfinished_sessions = find_unfinished_sessions(os.path.join(os.getcwd(), "temp_frames"))
+        if unfinished_sessions:
+            threading.Thread(target=self._recover_sessions, args=(unfinished_sessions,), daemon=True).start()
+
+        self.settings.subscribe(self._on_settings_changed)
+
+        # Idle callbacks run after the pending first paint
+        self.root.after_idle(self._warm_up)
+
+    def _warm_up(self):
+        """Load the heavy modules and probe encoders in the background once the window is drawn"""
+        threading.Thread(target=warm_up_imports, daemon=True).start()
+        self.encoder_probe.start()
+
     def create_left_column(self, parent):
         """Create left column with capture buttons"""
         left_frame = ttk.Frame(parent)
@@ -148,8 +2561,13 @@ class ScreenCaptureApp:
                   command=self.capture_full_screen, width=15).pack(fill=tk.X, pady=2)
         ttk.Button(img_frame, text="Selected Area", 
                   command=self.capture_selected_area, width=15).pack(fill=tk.X, pady=2)
+        ttk.Button(img_frame, text="Last Region", 
+                  command=self.capture_last_region, width=15).pack(fill=tk.X, pady=2)
         ttk.Button(img_frame, text="Active Window", 
                   command=self.capture_active_window, width=15).pack(fill=tk.X, pady=2)
+        self.burst_btn = ttk.Button(img_frame, text="Start Burst",
+                                  command=self.toggle_burst, width=15)
+        self.burst_btn.pack(fill=tk.X, pady=2)
         ttk.Button(img_frame, text="Save Screenshot", 
                   command=self.save_screenshot, width=15).pack(fill=tk.X, pady=2)
         ttk.Button(img_frame, text="Copy to Clipboard", 
@@ -161,6 +2579,15 @@ class ScreenCaptureApp:
         video_frame = ttk.LabelFrame(left_frame, text="Video Recording", padding="5")
         video_frame.pack(fill=tk.X, pady=(0, 10))
         
+        target_frame = ttk.Frame(video_frame)
+        target_frame.pack(fill=tk.X, pady=2)
+        ttk.Label(target_frame, text="Record:").pack(side=tk.LEFT)
+        self.recording_target_var = tk.StringVar(value=self.settings.recording_target)
+        target_menu = ttk.Combobox(target_frame, textvariable=self.recording_target_var,
+                                 values=["screen", "region", "window"], width=8, state="readonly")
+        target_menu.pack(side=tk.RIGHT)
+        target_menu.bind('<<ComboboxSelected>>', self.update_recording_target)
+        
         self.record_btn = ttk.Button(video_frame, text="Start Recording", 
                                    command=self.start_recording, width=15)
         self.record_btn.pack(fill=tk.X, pady=2)
@@ -184,19 +2611,37 @@ class ScreenCaptureApp:
         timer_label.pack(pady=2)
         
         # Video recording progress
-        self.video_progress_var = tk.StringVar(value="Frames: 0 | Segments: 0")
+        self.video_progress_var = tk.StringVar(value="Frames: 0 | Segments: 0 | Dropped: 0")
         video_progress_label = ttk.Label(video_frame, textvariable=self.video_progress_var,
                                        font=('Arial', 8))
         video_progress_label.pack(pady=2)
 
+        # Instant replay section
+        replay_frame = ttk.LabelFrame(left_frame, text="Instant Replay", padding="5")
+        replay_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.replay_btn = ttk.Button(replay_frame, text="Start Replay Buffer",
+                                   command=self.toggle_replay_buffer, width=15)
+        self.replay_btn.pack(fill=tk.X, pady=2)
+        
+        self.save_replay_btn = ttk.Button(replay_frame, text="Save Replay (F9)",
+                                        command=self.save_replay, state='disabled', width=15)
+        self.save_replay_btn.pack(fill=tk.X, pady=2)
+        self.root.bind('<F9>', self.save_replay)
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
+
         # Settings and Exit buttons
         control_frame = ttk.Frame(left_frame)
         control_frame.pack(fill=tk.X, pady=(10, 0))
         
+        ttk.Button(control_frame, text="History", 
+                  command=self.open_history, width=15).pack(fill=tk.X, pady=2)
+        ttk.Button(control_frame, text="Find Similar", 
+                  command=self.find_similar, width=15).pack(fill=tk.X, pady=2)
         ttk.Button(control_frame, text="Settings", 
                   command=self.open_settings, width=15).pack(fill=tk.X, pady=2)
         ttk.Button(control_frame, text="Exit", 
-                  command=self.root.quit, width=15).pack(fill=tk.X, pady=2)
+                  command=self.exit_app, width=15).pack(fill=tk.X, pady=2)
 
     def create_right_column(self, parent):
         """Create right column with preview and options"""
@@ -224,7 +2669,7 @@ class ScreenCaptureApp:
         ttk.Label(format_frame, text="Image Format:").pack(side=tk.LEFT)
         self.format_var = tk.StringVar(value=self.settings.save_format)
         format_menu = ttk.Combobox(format_frame, textvariable=self.format_var, 
-                                 values=["PNG", "JPG"], width=8, state="readonly")
+                                 values=IMAGE_FORMATS, width=8, state="readonly")
         format_menu.pack(side=tk.RIGHT)
         format_menu.bind('<<ComboboxSelected>>', self.update_format)
 
@@ -306,71 +2751,94 @@ class ScreenCaptureApp:
         height_entry = ttk.Entry(resolution_custom_frame, textvariable=height_var, width=6)
         height_entry.pack(side=tk.LEFT, padx=(2, 0))
 
+        # Recording performance HUD
+        metrics_frame = ttk.LabelFrame(right_frame, text="Performance", padding="5")
+        metrics_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        
+        self.metrics_var = tk.StringVar(value="Not recording")
+        ttk.Label(metrics_frame, textvariable=self.metrics_var, font=('Courier', 8),
+                  justify=tk.LEFT).pack(anchor=tk.W)
+        self.metrics_log_var = tk.BooleanVar(value=self.settings.metrics_log)
+        ttk.Checkbutton(metrics_frame, text="Log metrics to file", variable=self.metrics_log_var,
+                        command=self.update_metrics_log).pack(anchor=tk.W)
+
     # --- Image Capture Actions ---
     def capture_full_screen(self):
         """Capture the entire screen and resize to configured resolution"""
         try:
             # Add a small delay to let the UI update
             time.sleep(0.1)
-            screenshot = pyautogui.screenshot()
-            
-            # Resize to configured resolution
-            screenshot = screenshot.resize((self.settings.resolution_width, self.settings.resolution_height), Image.Resampling.LANCZOS)
+            # Grab and resize to configured resolution
+            screenshot = self._grab_image()
             
             self.last_image = screenshot
             self._update_preview()
-            self._auto_save_screenshot("full_screen")
-            self.status_var.set("Captured and saved full screen")
+            if self._auto_save_screenshot("full_screen"):
+                self.status_var.set("Captured full screen - saving...")
         except Exception as e:
             print(f"Full screen capture failed: {e}")
             self.status_var.set("Full screen capture failed")
 
     def capture_selected_area(self):
-        """Capture a selected area (simplified to center region for now)"""
-        try:
-            # For now, capture center region and resize to configured resolution
-            screen_width, screen_height = pyautogui.size()
-            capture_width = min(800, self.settings.resolution_width)
-            capture_height = min(600, self.settings.resolution_height)
-            left = (screen_width - capture_width) // 2
-            top = (screen_height - capture_height) // 2
-            
-            time.sleep(0.1)
-            screenshot = pyautogui.screenshot(region=(left, top, capture_width, capture_height))
-            
-            # Resize to configured resolution
-            screenshot = screenshot.resize((self.settings.resolution_width, self.settings.resolution_height), Image.Resampling.LANCZOS)
+        """Drag out a region on a screen overlay and capture it at native resolution"""
+        try:
+            screen_size = self._get_capture_backend().screen_size()
+            # Hide the app so it doesn't cover what's being selected
+            self.root.withdraw()
+            self.root.after(100, lambda: RegionSelector(self.root, screen_size, self._on_region_selected))
+        except Exception as e:
+            self.root.deiconify()
+            print(f"Selected area capture failed: {e}")
+            self.status_var.set("Selected area capture failed")
+
+    def _on_region_selected(self, region):
+        if region is None:
+            self.root.deiconify()
+            self.status_var.set("Region selection cancelled")
+            return
+        # Give the overlay time to disappear before grabbing
+        self.root.after(100, lambda: self._capture_region(region))
+
+    def capture_last_region(self):
+        """Capture the last selected region again without the overlay"""
+        if not self.settings.last_region:
+            self.capture_selected_area()
+            return
+        self._capture_region(tuple(self.settings.last_region))
+
+    def _capture_region(self, region):
+        """Grab just region, unscaled, and remember it for repeat grabs and recordings"""
+        try:
+            screenshot = self._grab_image(region=region, resize=False)
+            if list(region) != self.settings.last_region:
+                self.settings.last_region = list(region)
+                self.settings.save_settings()
             
             self.last_image = screenshot
             self._update_preview()
-            self._auto_save_screenshot("selected_area")
-            self.status_var.set("Captured and saved selected area (center region)")
+            if self._auto_save_screenshot("selected_area"):
+                self.status_var.set(f"Captured {region[2]}x{region[3]} region - saving...")
         except Exception as e:
             print(f"Selected area capture failed: {e}")
             self.status_var.set("Selected area capture failed")
+        finally:
+            self.root.deiconify()
 
     def capture_active_window(self):
         """Capture the active window and resize to configured resolution"""
         try:
             # Get active window info
-            active_window = pyautogui.getActiveWindow()
-            if active_window:
-                # Capture the window region
+            active_window = pyautogui.getActiveWindow() if pyautogui else None
+            region = self._window_region(active_window) if active_window else None
+            if region:
+                # Capture the window region and resize to configured resolution
                 time.sleep(0.1)
-                screenshot = pyautogui.screenshot(region=(
-                    active_window.left, 
-                    active_window.top, 
-                    active_window.width, 
-                    active_window.height
-                ))
-                
-                # Resize to configured resolution
-                screenshot = screenshot.resize((self.settings.resolution_width, self.settings.resolution_height), Image.Resampling.LANCZOS)
+                screenshot = self._grab_image(region=region)
                 
                 self.last_image = screenshot
                 self._update_preview()
-                self._auto_save_screenshot("active_window")
-                self.status_var.set("Captured and saved active window")
+                if self._auto_save_screenshot("active_window"):
+                    self.status_var.set("Captured active window - saving...")
             else:
                 # Fallback to full screen if no active window
                 self.capture_full_screen()
@@ -378,36 +2846,190 @@ class ScreenCaptureApp:
             print(f"Active window capture failed: {e}")
             self.status_var.set("Active window capture failed")
 
+    def toggle_burst(self):
+        """Start a timed burst of full screen shots, or stop the running one"""
+        if self.burst_thread is not None and self.burst_thread.is_alive():
+            self.burst_stop.set()
+            self.status_var.set("Stopping burst...")
+            return
+
+        self.burst_stop.clear()
+        # Tk variables and the lazily created backend are only touched here, on the Tk thread
+        self.burst_thread = threading.Thread(target=self._burst_loop, daemon=True,
+                                             args=(self._get_capture_backend(), self.format_var.get(),
+                                                   self.save_dir_var.get()))
+        self.burst_thread.start()
+        self.burst_btn.config(text="Stop Burst")
+        count = self.settings.burst_count
+        shots = f"{count} shots" if count else "shots until stopped"
+        self.status_var.set(f"Burst: {shots} every {self.settings.burst_interval_ms} ms")
+
+    def _burst_loop(self, backend, image_format, save_dir):
+        """Take burst shots on fixed deadlines and hand them to the background writer"""
+        count = self.settings.burst_count
+        scheduler = FrameScheduler(1000.0 / self.settings.burst_interval_ms, max_catchup_frames=1,
+                                   stop_event=self.burst_stop)
+        resizer = FrameResizer(self.settings.resolution_width, self.settings.resolution_height,
+                               self.settings.still_resize_filter)
+        # One buffer per queued or in-flight save, plus the one being filled
+        pool = ImageBufferPool(self.image_writer.queue.maxsize + len(self.image_writer.threads) + 1)
+        params = image_save_params(self.settings.burst_profile, image_format)
+        prefix = os.path.join(save_dir, f"burst_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+        progress = {'saved': 0, 'failed': 0}
+        taken = dropped = 0
+
+        skipped = 0
+
+        def on_saved(buffer, path, error, image_hash):
+            if error is None and image_hash is None:
+                image_hash = dhash(buffer)  # Hashed here, on the writer thread, before the buffer is reused
+            pool.release(buffer)
+            if error is not None:
+                progress['failed'] += 1
+                print(f"Burst save failed: {error}")
+            else:
+                progress['saved'] += 1
+                self.last_image_path = path
+                self.retention.add(path)
+                self.hash_index.add(path, image_hash)
+
+        while not self.burst_stop.is_set() and (count == 0 or taken + dropped + skipped < count):
+            try:
+                scheduler.wait()
+                if self.burst_stop.is_set():
+                    break
+                frame = resizer.resize(backend.grab())
+                # Only hash here when it decides whether to save; otherwise the writer thread does it
+                image_hash = dhash(frame) if self.settings.skip_duplicates else None
+                if image_hash is not None and self._is_near_duplicate(image_hash):
+                    skipped += 1
+                    continue
+                buffer = pool.acquire(frame.shape, timeout=scheduler.interval)
+                if buffer is None:
+                    # Every buffer is waiting on the writer: the disk can't keep up
+                    dropped += 1
+                    continue
+                cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffer)
+                path = f"{prefix}_{taken + 1:04d}.{image_format.lower()}"
+                callback = lambda path, error, buffer=buffer, image_hash=image_hash: on_saved(buffer, path, error, image_hash)
+                if not self.image_writer.submit(Image.fromarray(buffer), path, image_format, params, callback,
+                                                timeout=scheduler.interval):
+                    pool.release(buffer)
+                    dropped += 1
+                    continue
+                taken += 1
+                self.last_saved_hash = image_hash
+                self.ui.set(self.status_var, f"Burst: {taken} taken | {progress['saved']} saved | "
+                                             f"{skipped} duplicates | {dropped} dropped")
+            except Exception as e:
+                print(f"Error in burst loop: {e}")
+                self.ui.set(self.status_var, f"Burst error: {str(e)}")
+                break
+
+        self.image_writer.flush()
+        missed = scheduler.frames_skipped + dropped
+        self.ui.set(self.status_var, f"Burst done: {progress['saved']} saved, {progress['failed']} failed, "
+                                     f"{skipped} duplicates skipped, {missed} missed")
+        self.ui.call(lambda: self.burst_btn.config(text="Start Burst"))
+
+    def _window_region(self, window):
+        """Current (left, top, width, height) of a window clipped to the screen, or None if it's off screen"""
+        screen_width, screen_height = self._get_capture_backend().screen_size()
+        left = max(0, window.left)
+        top = max(0, window.top)
+        right = min(screen_width, window.left + window.width)
+        bottom = min(screen_height, window.top + window.height)
+        if right - left < 2 or bottom - top < 2:
+            return None  # Minimized or moved off screen
+        return left, top, right - left, bottom - top
+
+    def _recording_source(self):
+        """Return (region source, output size) for the configured recording target.
+
+        The region source is None for the full screen, otherwise a callable
+        returning the rectangle to grab next, or None while the target is
+        not visible. Region and window targets are recorded at their own
+        size, scaled down only to fit the configured resolution.
+        """
+        max_size = (self.settings.resolution_width, self.settings.resolution_height)
+        target = self.settings.recording_target
+        if target == "region" and self.settings.last_region:
+            region = tuple(self.settings.last_region)
+            return (lambda: region), fit_within(region[2], region[3], *max_size)
+        if target == "window":
+            try:
+                window = pyautogui.getActiveWindow() if pyautogui else None
+                region = self._window_region(window) if window else None
+            except Exception as e:  # getActiveWindow is only implemented on Windows
+                print(f"Could not find the active window: {e}")
+                region = None
+            if region:
+                return (lambda: self._window_region(window)), fit_within(region[2], region[3], *max_size)
+            print("No active window to record, recording the full screen")
+        return None, max_size
+
+    def _get_capture_backend(self):
+        """Return the capture backend chosen in settings, creating it on first use"""
+        if self.capture_backend is None:
+            self.capture_backend = create_capture_backend(self.settings.capture_backend)
+        return self.capture_backend
+
+    def _grab_image(self, region=None, resize=True):
+        """Grab the screen (or a region) as a PIL image, resized with the still filter unless resize is False"""
+        frame = self._get_capture_backend().grab(region)
+        if resize:
+            self.still_resizer.configure(self.settings.resolution_width, self.settings.resolution_height,
+                                         self.settings.still_resize_filter)
+            frame = self.still_resizer.resize(frame)
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
     def _auto_save_screenshot(self, capture_type):
-        """Automatically save screenshot with timestamped filename"""
+        """Queue the screenshot for saving with a timestamped filename; returns False if it wasn't"""
         if self.last_image is None:
-            return
-            
-        try:
-            # Create readable timestamped filename
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            filename = f"screenshot_{timestamp}.{self.format_var.get().lower()}"
-            filepath = os.path.join(self.save_dir_var.get(), filename)
-            
-            # Debug info
-            print(f"Saving to: {filepath}")
-            print(f"Save directory: {self.save_dir_var.get()}")
-            print(f"Directory exists: {os.path.exists(self.save_dir_var.get())}")
-            
-            # Ensure directory exists
-            save_dir = self.save_dir_var.get()
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir)
-                print(f"Created directory: {save_dir}")
-            
-            # Save the image
-            self.last_image.save(filepath, self.format_var.get())
-            self.last_image_path = filepath
-            print(f"Successfully saved: {filepath}")
+            return False
+        image = self.last_image
+        # Only hash here when it decides whether to save; otherwise the writer thread does it
+        image_hash = dhash(image) if self.settings.skip_duplicates else None
+        if image_hash is not None and self._is_near_duplicate(image_hash):
+            self.status_var.set("Skipped - looks the same as the previous capture")
+            return False
             
-        except Exception as e:
-            print(f"Auto-save failed: {e}")
-            self.status_var.set("Capture successful but auto-save failed")
+        # Create readable timestamped filename (milliseconds keep rapid captures apart)
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")[:-3]
+        filename = f"screenshot_{timestamp}.{self.format_var.get().lower()}"
+        filepath = os.path.join(self.save_dir_var.get(), filename)
+        print(f"Saving to: {filepath}")
+        
+        if not self.image_writer.submit(image, filepath, self.format_var.get(), self._image_save_params(),
+                                        lambda path, error: self._on_screenshot_saved(path, error, image, image_hash)):
+            self.status_var.set("Capture successful but the save queue is full")
+            return False
+        self.last_saved_hash = image_hash  # None when skipping is off, so turning it on starts fresh
+        return True
+
+    def _is_near_duplicate(self, image_hash):
+        """True if duplicate skipping is on and image_hash is close to the last saved capture's"""
+        return (self.settings.skip_duplicates and self.last_saved_hash is not None
+                and hamming(image_hash, self.last_saved_hash) <= self.settings.duplicate_distance)
+
+    def _image_save_params(self):
+        """Encoder options for the current image format and profile"""
+        return image_save_params(self.settings.image_profile, self.format_var.get())
+
+    def _on_screenshot_saved(self, path, error, image=None, image_hash=None):
+        """Report a finished background save and index its hash (runs on a writer thread)"""
+        if error is not None:
+            print(f"Auto-save failed: {error}")
+            self.ui.set(self.status_var, f"Saving {os.path.basename(path)} failed: {error}")
+            return
+        self.last_image_path = path
+        self.retention.add(path)
+        if image_hash is None and image is not None:
+            image_hash = dhash(image)
+        if image_hash is not None:
+            self.hash_index.add(path, image_hash)
+        print(f"Successfully saved: {path}")
+        self.ui.set(self.status_var, f"Saved screenshot: {os.path.basename(path)}")
 
     def save_screenshot(self):
         if self.last_image is None:
@@ -418,23 +3040,35 @@ class ScreenCaptureApp:
         path = filedialog.asksaveasfilename(defaultextension=default_ext, filetypes=filetypes, 
                                           initialdir=self.save_dir_var.get())
         if path:
-            self.last_image.save(path, self.format_var.get())
-            self.last_image_path = path
-            self.status_var.set(f"Saved screenshot: {os.path.basename(path)}")
-            self._update_preview(path)
+            image = self.last_image
+            if self.image_writer.submit(image, path, self.format_var.get(), self._image_save_params(),
+                                        lambda path, error: self._on_screenshot_saved(path, error, image),
+                                        timeout=2):
+                self.status_var.set(f"Saving screenshot: {os.path.basename(path)}...")
+            else:
+                self.status_var.set("Save queue is full - try again")
     
     def copy_to_clipboard(self):
         if self.last_image is None:
             self.status_var.set("No screenshot to copy")
             return
         try:
-            self.root.clipboard_clear()
-            # Convert to Tk image and put on clipboard
-            output = tk.PhotoImage(self.last_image)
-            self.root.clipboard_append(output)
-            self.status_var.set("Copied screenshot to clipboard")
+            if self.clipboard_exporter is None:
+                self.clipboard_exporter = ClipboardExporter(create_clipboard())
         except Exception as e:
             self.status_var.set(f"Clipboard error: {e}")
+            return
+        # Encoding a 4K capture takes a while, so it happens on the exporter's thread
+        self.clipboard_exporter.copy(self.last_image, self._on_clipboard_copied)
+        self.status_var.set("Copying screenshot to clipboard...")
+
+    def _on_clipboard_copied(self, error):
+        """Report a finished clipboard copy (runs on the exporter thread)"""
+        if error is not None:
+            print(f"Clipboard copy failed: {error}")
+            self.ui.set(self.status_var, f"Clipboard error: {error}")
+        else:
+            self.ui.set(self.status_var, "Copied screenshot to clipboard")
 
     def open_last_screenshot(self):
         if self.last_image_path and os.path.exists(self.last_image_path):
@@ -444,33 +3078,81 @@ class ScreenCaptureApp:
             self.status_var.set("No screenshot to open")
 
     # --- Video Recording Actions ---
-    def start_recording(self):
+    def start_recording(self, target_ready=False):
         """Start video recording by capturing screenshots at regular intervals"""
+        if self.settings.recording_target == "window" and not target_ready and not self.is_recording:
+            # Step aside so the window to record becomes the active one
+            self.root.iconify()
+            self.root.after(300, lambda: self.start_recording(target_ready=True))
+            return
         if not self.is_recording:
-            self.is_recording = True
-            self.recording_start_time = time.time()
-            self.current_video_start_time = time.time()
-            self.frames_captured = 0
-            self.captured_frames = []
-            self.segments_created = 0  # Initialize segments counter
-            
-            # Update UI
-            self.record_btn.config(state='disabled')
-            self.stop_btn.config(state='normal')
-            self.recording_status_var.set("Recording...")
-            self.video_progress_var.set("Frames: 0 | Segments: 0")
-            
-            # Start recording thread
-            self.recording_thread = threading.Thread(target=self._recording_loop, daemon=True)
-            self.recording_thread.start()
-            
-            # Start timer update
-            self._update_timer()
-            
-            self.status_var.set(f"Recording started - capturing {self.frames_per_second} fps, saving {self.clip_duration_seconds}-second clips")
+            try:
+                self._begin_recording()
+            except Exception as e:
+                print(f"Could not start recording: {e}")
+                self.is_recording = False
+                self.record_btn.config(state='normal')
+                self.stop_btn.config(state='disabled')
+                self.recording_status_var.set("Not Recording")
+                self.status_var.set(f"Could not start recording: {e}")
+                self.root.deiconify()  # Window mode minimized the app
+
+    def _begin_recording(self):
+        """Set up the capture and encoder stages for a new recording and start them"""
+        # FPS changes made during the last recording apply from this one
+        self.frames_per_second = self.settings.fps
+        self.recording_region_source, output_size = self._recording_source()
+        self.recording_output_size = output_size
+        self.is_recording = True
+        self.recording_start_time = time.time()
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_unchanged = 0
+        self.frame_scheduler = None
+        self.segments_created = 0  # Initialize segments counter
+        self.metrics = PipelineMetrics()
+        
+        # Capture and encode stages are joined by the bounded frame buffer
+        session_dir = os.path.join(os.getcwd(), "temp_frames", f"session_{int(self.recording_start_time * 1000)}")
+        encoder_options = {'preset': self.settings.ffmpeg_preset, 'crf': self.settings.ffmpeg_crf}
+        # The journal lets the next start finish this session if the app dies mid-recording
+        journal = RecordingJournal(session_dir)
+        journal.append("session", sync=True, save_dir=self.settings.save_dir, fps=self.frames_per_second,
+                       width=output_size[0], height=output_size[1], encoder=self.settings.video_encoder,
+                       encoder_options=encoder_options)
+        self.frame_buffer = FrameRingBuffer(output_size[0], output_size[1],
+                                            self.settings.frame_buffer_mb, session_dir,
+                                            max_spill_mb=self.settings.frame_spill_mb, journal=journal)
+        self.segment_encoder = SegmentEncoder(self.frame_buffer, self.settings.save_dir, self.frames_per_second,
+                                              self.frames_per_second * self.clip_duration_seconds,
+                                              encoder=self.settings.video_encoder,
+                                              encoder_options=encoder_options,
+                                              encoder_probe=self.encoder_probe,
+                                              on_segment=self._on_segment_saved,
+                                              on_status=lambda message: self.ui.set(self.status_var, message),
+                                              on_finished=self._on_encoding_finished,
+                                              metrics=self.metrics,
+                                              journal=journal,
+                                              space_check=self.retention.ensure_free_space)
+        self.segment_encoder.start()
+        
+        # Update UI
+        self.record_btn.config(state='disabled')
+        self.stop_btn.config(state='normal')
+        self.recording_status_var.set("Recording...")
+        self._update_video_progress()
+        
+        # Start recording thread
+        self.recording_thread = threading.Thread(target=self._recording_loop, daemon=True)
+        self.recording_thread.start()
+        
+        # Start timer update
+        self._update_timer()
+        
+        self.status_var.set(f"Recording started - capturing {self.frames_per_second} fps, saving {self.clip_duration_seconds}-second clips")
 
     def stop_recording(self):
-        """Stop video recording and save final video segment"""
+        """Stop video recording; the encoder finishes the final segment in the background"""
         if self.is_recording:
             self.is_recording = False
             
@@ -480,194 +3162,288 @@ class ScreenCaptureApp:
             self.recording_status_var.set("Not Recording")
             self.timer_var.set("00:00")
             
-            # Save any remaining frames as final video
-            if self.captured_frames:
-                self._save_video_segment()
-            
-            self.status_var.set("Recording stopped")
+            self.status_var.set("Recording stopped - saving final clip...")
+
+    def _create_frame_scheduler(self):
+        """Deadlines for _recording_loop at the recording frame rate"""
+        return FrameScheduler(self.frames_per_second)
 
     def _recording_loop(self):
-        """Main recording loop that captures frames at regular intervals"""
+        """Capture stage: grab frames on fixed deadlines and hand them to the encoder"""
         frame_interval = 1.0 / self.frames_per_second  # 1/24 second between frames (24 fps)
+        frame_buffer = self.frame_buffer
+        scheduler = self.frame_scheduler = self._create_frame_scheduler()
+        backend = self._get_capture_backend()
+        region_source = self.recording_region_source
+        resizer = FrameResizer(*self.recording_output_size, self.settings.video_resize_filter)
+        differ = FrameDiffer()
+        metrics = self.metrics
+        metrics_path = self._metrics_path() if self.settings.metrics_log else None
+        next_report = time.monotonic() + 1.0
         
         while self.is_recording:
             try:
-                # Capture screenshot
-                screenshot = pyautogui.screenshot()
+                # Settings changed mid-recording (queued by _on_settings_changed)
+                try:
+                    changes = self.recording_changes.get_nowait()
+                except queue.Empty:
+                    changes = {}
+                if "video_resize_filter" in changes:
+                    resizer.configure(resizer.width, resizer.height, changes["video_resize_filter"])
+                if "metrics_log" in changes:
+                    metrics_path = self._metrics_path() if changes["metrics_log"] else None
+                if "clip_duration_seconds" in changes:
+                    self.segment_encoder.set_frames_per_clip(self.frames_per_second * changes["clip_duration_seconds"])
                 
-                # Resize to configured resolution
-                screenshot = screenshot.resize((self.settings.resolution_width, self.settings.resolution_height), Image.Resampling.LANCZOS)
+                # Wait for the next frame deadline; late captures fill the slots they missed
+                slots = scheduler.wait()
+                if not self.is_recording:
+                    break
                 
+                # Capture the recording target as a BGR array; while a tracked
+                # window is hidden, hold its last frame
+                region = region_source() if region_source else None
+                if region_source and region is None:
+                    if frame_buffer.extend_last(slots):
+                        self.frames_captured += slots
+                    else:
+                        self.frames_dropped += slots
+                    self._update_video_progress()
+                    continue
+                started = time.perf_counter()
+                frame = backend.grab(region)
                 timestamp = time.time()
+                grabbed = time.perf_counter()
+                metrics.record("grab", grabbed - started)
+                metrics.frame_captured()
                 
-                # Save frame to temporary file
-                frame_path = self._save_frame(screenshot, timestamp)
-                self.captured_frames.append(frame_path)
-                self.frames_captured += 1
+                # An unchanged screen only extends the previous frame, skipping the
+                # resize and copy; playback stays in real time
+                self.changed_tiles = differ.compare(frame)
+                metrics.record("diff", time.perf_counter() - grabbed)
+                if time.monotonic() >= next_report:
+                    next_report += 1.0
+                    self._report_metrics(metrics_path)
+                if not self.changed_tiles.any():
+                    self.frames_unchanged += slots
+                    if frame_buffer.extend_last(slots):
+                        self.frames_captured += slots
+                        self._update_video_progress()
+                        continue
                 
-                # Update progress display
-                self.video_progress_var.set(f"Frames: {self.frames_captured} | Segments: {self.segments_created}")
+                # Resize to configured resolution (skipped if the grab already matches)
+                started = time.perf_counter()
+                frame = resizer.resize(frame)
+                resized = time.perf_counter()
+                metrics.record("resize", resized - started)
                 
-                # Check if we need to save a video segment (every X seconds = Y frames)
-                frames_per_clip = self.frames_per_second * self.clip_duration_seconds  # e.g., 24 fps * 5 seconds = 120 frames
-                print(f"Debug: {len(self.captured_frames)} frames captured, need {frames_per_clip} for clip")
-                if len(self.captured_frames) >= frames_per_clip:
-                    print(f"Debug: Saving video clip {self.segments_created + 1} with {len(self.captured_frames)} frames")
-                    self.status_var.set(f"Saving video clip {self.segments_created + 1}...")
-                    self._save_video_segment()
-                    self.segments_created += 1  # Increment segments counter
-                    self.current_video_start_time = time.time()
+                # Copy raw frame into the ring buffer, waiting at most half a
+                # frame interval for the encoder to free a slot
+                if frame_buffer.push(frame, timestamp, timeout=frame_interval / 2, repeat=slots):
+                    self.frames_captured += slots
+                else:
+                    self.frames_dropped += slots
+                metrics.record("queue_wait", time.perf_counter() - resized)
                 
-                # Wait for next frame
-                time.sleep(frame_interval)
+                # Update progress display
+                self._update_video_progress()
                 
             except Exception as e:
                 print(f"Error in recording loop: {e}")
-                self.status_var.set(f"Recording error: {str(e)}")
+                self.ui.set(self.status_var, f"Recording error: {str(e)}")
                 time.sleep(1)
-
-    def _save_frame(self, screenshot, timestamp):
-        """Save a single frame to temporary storage"""
-        # Create temp directory if it doesn't exist
-        temp_dir = os.path.join(os.getcwd(), "temp_frames")
-        os.makedirs(temp_dir, exist_ok=True)
         
-        # Save frame with timestamp
-        frame_filename = f"frame_{int(timestamp * 1000)}.png"
-        frame_path = os.path.join(temp_dir, frame_filename)
-        screenshot.save(frame_path)
-        
-        return frame_path
+        # Let the encoder flush whatever is still buffered
+        self.segment_encoder.finish()
+
+    def _metrics_path(self):
+        session = datetime.fromtimestamp(self.recording_start_time).strftime('%Y%m%d_%H%M%S')
+        return os.path.join(self.settings.save_dir, f"metrics_{session}.jsonl")
+
+    def _report_metrics(self, metrics_path=None):
+        """Show a metrics snapshot in the HUD and optionally append it to the metrics file (capture thread)"""
+        snapshot = self.metrics.snapshot()
+        snapshot["time"] = time.time()
+        snapshot["dropped"] = self.frames_dropped + (self.frame_scheduler.frames_skipped if self.frame_scheduler else 0)
+        snapshot["queue_depth"] = len(self.frame_buffer)
+
+        lines = ["stage    p50ms  p95ms"]
+        for name, label in (("grab", "grab"), ("resize", "resize"), ("diff", "diff"),
+                            ("queue_wait", "queue"), ("encode", "encode"), ("disk_write", "disk")):
+            values = snapshot["stages"][name]
+            if values:
+                lines.append(f"{label:<7}{values[0]:>6.1f}{values[1]:>7.1f}")
+            else:
+                lines.append(f"{label:<7}{'-':>6}{'-':>7}")
+        lines.append(f"{snapshot['fps']:.1f} fps | dropped {snapshot['dropped']} | queue {snapshot['queue_depth']}")
+        lines.append(f"written {snapshot['bytes_written'] / (1024 * 1024):.1f} MB")
+        self.ui.set(self.metrics_var, "\n".join(lines))
+
+        if metrics_path:
+            try:
+                with open(metrics_path, 'a') as f:
+                    f.write(json.dumps(snapshot) + "\n")
+            except OSError as e:
+                print(f"Could not write metrics: {e}")
+
+    def _recover_sessions(self, sessions):
+        """Finalize recording sessions whose journal shows they never finished"""
+        recovered = []
+        for session_dir in sessions:
+            self.ui.set(self.status_var, f"Recovering interrupted recording {os.path.basename(session_dir)}...")
+            try:
+                session_videos = recover_session(session_dir, self.encoder_probe.get())
+                for video_path in session_videos:
+                    self.retention.add(video_path)
+                    self.hash_index.add_file(video_path)
+                recovered += session_videos
+            except Exception as e:
+                print(f"Could not recover {session_dir}: {e}")
+        if recovered:
+            self.last_video_path = recovered[-1]
+            self.ui.set(self.status_var, f"Recovered {len(recovered)} video file(s) from an interrupted recording")
+        else:
+            self.ui.set(self.status_var, "Interrupted recording had nothing left to recover")
+
+    def _on_segment_saved(self, video_path, frame_count, timestamps):
+        """Called from the encoder thread when a segment file is complete"""
+        self.last_video_path = video_path
+        self.retention.add(video_path)
+        self.hash_index.add_file(video_path)
+        self.segments_created += 1
+        self._update_video_progress()
 
-    def _save_video_segment(self):
-        """Save captured frames as a video segment"""
-        if not self.captured_frames:
+    def _on_encoding_finished(self):
+        """Called from the encoder thread once the final segment is written"""
+        if not self.is_recording:
+            self.ui.set(self.status_var, f"Recording stopped - {self.segments_created} clip(s) saved")
+        elif self.segment_encoder is not None and self.segment_encoder.error is not None:
+            # The encoder gave up (e.g. the disk is full): stop capturing into a dead pipeline
+            error = self.segment_encoder.error
+            self.ui.call(self.stop_recording)
+            self.ui.set(self.status_var, f"Recording stopped - {self.segments_created} clip(s) saved ({error})")
+
+    def _update_video_progress(self):
+        """Show capture, segment and dropped-frame counters (safe to call from any thread)"""
+        # Slots the scheduler skipped after a stall count as dropped too
+        dropped = self.frames_dropped + (self.frame_scheduler.frames_skipped if self.frame_scheduler else 0)
+        self.ui.set(self.video_progress_var, f"Frames: {self.frames_captured} | Segments: {self.segments_created} | "
+                    f"Dropped: {dropped}")
+
+    # --- Replay Buffer Actions ---
+    def toggle_replay_buffer(self):
+        """Start or stop keeping the last few seconds of screen in memory"""
+        if self.replay_active:
+            self.replay_active = False
+            self._stop_replay_hotkey()
+            self.replay_btn.config(text="Start Replay Buffer")
+            self.save_replay_btn.config(state='disabled')
+            self.status_var.set("Replay buffer stopped")
             return
-        
-        try:
-            # Create video filename with timestamp
-            video_start_time = datetime.fromtimestamp(self.current_video_start_time)
-            video_filename = f"screen_recording_{video_start_time.strftime('%Y%m%d_%H%M%S')}.mp4"
-            
-            # Ensure save directory exists
-            save_dir = self.settings.save_dir
-            os.makedirs(save_dir, exist_ok=True)
-            video_path = os.path.join(save_dir, video_filename)
-            
-            # Use ffmpeg to create video from frames
-            self._create_video_from_frames(video_path)
-            
-            # Update last video path
-            self.last_video_path = video_path
-            
-            # Clear captured frames for next segment
-            self._cleanup_frames()
-            self.captured_frames = []
-            
-            self.status_var.set(f"Video segment saved: {video_filename}")
-            
-            # Update video progress
-            self.video_progress_var.set(f"Frames: {self.frames_captured} | Segments: {self.segments_created}")
-            
-        except Exception as e:
-            print(f"Error saving video segment: {e}")
-            self.status_var.set("Error saving video segment")
 
-    def _create_video_from_frames(self, output_path):
-        """Create video from captured frames using OpenCV"""
-        if not self.captured_frames:
+        self.replay_fps = self.settings.fps
+        self.replay_buffer = ReplayBuffer(self.settings.replay_duration_seconds, self.settings.replay_memory_mb,
+                                          self.settings.replay_jpeg_quality, fps=self.replay_fps)
+        self.replay_active = True
+        self.replay_thread = threading.Thread(target=self._replay_loop, daemon=True)
+        self.replay_thread.start()
+        self.replay_btn.config(text="Stop Replay Buffer")
+        self.save_replay_btn.config(state='normal')
+        hotkey = "F9 in any app" if self._start_replay_hotkey() else "F9 in this window"
+        self.status_var.set(f"Replay buffer on - keeping the last {self.settings.replay_duration_seconds}s "
+                            f"({hotkey} to save)")
+
+    def _start_replay_hotkey(self):
+        """Listen for F9 system-wide with pynput; returns False if only the in-app binding works"""
+        if pynput_keyboard:
+            try:
+                self.replay_hotkey = pynput_keyboard.GlobalHotKeys(
+                    {"<f9>": lambda: self.ui.call(self.save_replay)})
+                self.replay_hotkey.start()
+                self.root.unbind('<F9>')  # The listener sees F9 in this window too
+                return True
+            except Exception as e:
+                print(f"Global F9 hotkey unavailable, F9 only works in this window: {e}")
+                self.replay_hotkey = None
+        return False
+
+    def _stop_replay_hotkey(self):
+        if self.replay_hotkey is not None:
+            self.replay_hotkey.stop()
+            self.replay_hotkey = None
+            self.root.bind('<F9>', self.save_replay)
+
+    def _replay_loop(self):
+        """Capture frames on fixed deadlines into the compressed replay buffer"""
+        replay_buffer = self.replay_buffer
+        scheduler = FrameScheduler(self.replay_fps)
+        backend = self._get_capture_backend()
+        resizer = FrameResizer(self.settings.resolution_width, self.settings.resolution_height,
+                               self.settings.video_resize_filter)
+        differ = FrameDiffer()
+
+        while self.replay_active:
+            try:
+                slots = scheduler.wait()
+                if not self.replay_active:
+                    break
+                frame = backend.grab()
+                timestamp = time.time()
+                if not differ.compare(frame).any() and replay_buffer.extend_last(slots):
+                    continue
+                replay_buffer.add(resizer.resize(frame), timestamp, repeat=slots)
+            except Exception as e:
+                print(f"Error in replay loop: {e}")
+                self.ui.set(self.status_var, f"Replay buffer error: {str(e)}")
+                time.sleep(1)
+
+    def save_replay(self, event=None):
+        """Encode the current replay buffer to a video file in the background"""
+        if not self.replay_active or self.replay_buffer is None or not len(self.replay_buffer):
+            self.status_var.set("Replay buffer is empty")
             return
-        
+        entries = self.replay_buffer.snapshot()
+        self.status_var.set(f"Saving replay ({len(entries)} frames)...")
+        threading.Thread(target=self._encode_replay, args=(entries,), daemon=True).start()
+
+    def _encode_replay(self, entries):
+        """Decode the snapshot frame by frame and write it as one video"""
         try:
-            print(f"Creating video from {len(self.captured_frames)} frames...")
-            self.status_var.set(f"Creating video from {len(self.captured_frames)} frames...")
-            
-            # Get the first frame to determine video dimensions
-            first_frame = cv2.imread(self.captured_frames[0])
-            if first_frame is None:
-                raise Exception("Could not read first frame")
-            
-            height, width, layers = first_frame.shape
-            print(f"Video dimensions: {width}x{height}")
-            
-            # Try different codecs in order of preference
-            codecs_to_try = [
-                ('mp4v', '.mp4'),
-                ('XVID', '.avi'),
-                ('MJPG', '.avi'),
-                ('H264', '.mp4')
-            ]
-            
-            video_writer = None
-            for codec, ext in codecs_to_try:
-                try:
-                    print(f"Trying codec: {codec}")
-                    fourcc = cv2.VideoWriter_fourcc(*codec)
-                    temp_path = output_path.replace('.mp4', ext)
-                    video_writer = cv2.VideoWriter(temp_path, fourcc, self.frames_per_second, (width, height))
-                    
-                    if video_writer.isOpened():
-                        print(f"Successfully opened video writer with codec: {codec}")
-                        output_path = temp_path
-                        break
-                    else:
-                        video_writer.release()
-                        video_writer = None
-                except Exception as e:
-                    print(f"Failed with codec {codec}: {e}")
-                    if video_writer:
-                        video_writer.release()
-                        video_writer = None
-            
-            if video_writer is None:
-                raise Exception("Could not create video writer with any codec")
-            
-            # Add each frame to the video
+            video_start_time = datetime.fromtimestamp(entries[0][0])
+            os.makedirs(self.settings.save_dir, exist_ok=True)
+            video_path = os.path.join(self.settings.save_dir, f"replay_{video_start_time.strftime('%Y%m%d_%H%M%S')}.mp4")
+
+            first_frame = cv2.imdecode(np.frombuffer(entries[0][1], dtype=np.uint8), cv2.IMREAD_COLOR)
+            frame_size = (first_frame.shape[1], first_frame.shape[0])
+            video_writer, video_path = open_video_writer(video_path, self.replay_fps, frame_size,
+                                                         self.settings.video_encoder,
+                                                         preset=self.settings.ffmpeg_preset,
+                                                         crf=self.settings.ffmpeg_crf,
+                                                         capabilities=self.encoder_probe.get())
             frames_written = 0
-            for i, frame_path in enumerate(self.captured_frames):
-                if os.path.exists(frame_path):
-                    frame = cv2.imread(frame_path)
-                    if frame is not None:
-                        video_writer.write(frame)
-                        frames_written += 1
-                        
-                        # Update progress every 10 frames
-                        if i % 10 == 0:
-                            progress = (i / len(self.captured_frames)) * 100
-                            self.status_var.set(f"Creating video: {progress:.1f}% ({frames_written}/{len(self.captured_frames)} frames)")
-                            self.root.update()
-            
-            # Release video writer
+            for timestamp, data, repeat in entries:
+                frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                for _ in range(repeat):
+                    video_writer.write(frame)
+                    frames_written += 1
             video_writer.release()
-            
-            # Verify video was created
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
-                self.status_var.set(f"Video created: {os.path.basename(output_path)} ({file_size:.1f} MB)")
-                print(f"Video created successfully: {output_path} ({file_size:.1f} MB)")
-                
-                # Update video progress
-                self.video_progress_var.set(f"Frames: {self.frames_captured} | Segments: {self.segments_created}")
-            else:
-                raise Exception("Video file was not created or is empty")
-                
-        except Exception as e:
-            print(f"Error creating video: {e}")
-            self.status_var.set(f"Video creation failed: {str(e)}")
-            # Fallback: save frames with instructions
-            self._save_frames_with_instructions()
-            raise
-
-    def _cleanup_frames(self):
-        """Clean up temporary frame files"""
-        try:
-            temp_dir = os.path.join(os.getcwd(), "temp_frames")
-            if os.path.exists(temp_dir):
-                for file in os.listdir(temp_dir):
-                    if file.startswith("frame_") and file.endswith(".png"):
-                        os.remove(os.path.join(temp_dir, file))
+
+            self.last_video_path = video_path
+            self.retention.add(video_path)
+            self.hash_index.add_file(video_path)
+            duration = frames_written / self.replay_fps
+            self.ui.set(self.status_var, f"Replay saved: {os.path.basename(video_path)} ({duration:.1f}s)")
         except Exception as e:
-            print(f"Error cleaning up frames: {e}")
+            print(f"Error saving replay: {e}")
+            self.ui.set(self.status_var, f"Replay save failed: {str(e)}")
+
+    def exit_app(self):
+        """Finish pending screenshot saves, then quit"""
+        if self.image_writer.pending():
+            self.status_var.set("Finishing screenshot saves...")
+            self.root.update_idletasks()
+            self.image_writer.flush(timeout=10)
+        self.root.quit()
 
     def _update_timer(self):
         """Update the recording timer display"""
@@ -680,17 +3456,52 @@ class ScreenCaptureApp:
             # Schedule next update
             self.root.after(1000, self._update_timer)
 
+    def _open_path(self, path):
+        """Open a file with the system's default application"""
+        if sys.platform == "win32":
+            os.startfile(path)
+        elif sys.platform == "darwin":  # macOS
+            subprocess.run(["open", path])
+        else:  # Linux
+            subprocess.run(["xdg-open", path])
+
+    def open_history(self):
+        """Browse earlier captures in save_dir"""
+        if self.thumbnail_cache is None:
+            self.thumbnail_cache = ThumbnailCache(self.settings.thumbnail_cache_dir)
+        HistoryGallery(self.root, self.retention.files(), self.thumbnail_cache, self.ui, self._open_capture)
+
+    def find_similar(self):
+        """Show saved screenshots and recordings that look like the last capture"""
+        if self.last_image is None:
+            self.status_var.set("Capture something first to find similar captures")
+            return
+        if self.thumbnail_cache is None:
+            self.thumbnail_cache = ThumbnailCache(self.settings.thumbnail_cache_dir)
+        matches = self.hash_index.similar(dhash(self.last_image))
+        files = []
+        for _, path in matches:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat.st_mtime, stat.st_size))
+        self.status_var.set(f"Found {len(files)} similar capture(s)")
+        HistoryGallery(self.root, files, self.thumbnail_cache, self.ui, self._open_capture, title="Similar Captures")
+
+    def _open_capture(self, path):
+        try:
+            self._open_path(path)
+            self.status_var.set(f"Opened {os.path.basename(path)}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open {os.path.basename(path)}: {e}")
+
     def open_last_video(self):
         """Open the last recorded video file"""
         if self.last_video_path and os.path.exists(self.last_video_path):
             try:
                 # Use default system video player
-                if sys.platform == "win32":
-                    os.startfile(self.last_video_path)
-                elif sys.platform == "darwin":  # macOS
-                    subprocess.run(["open", self.last_video_path])
-                else:  # Linux
-                    subprocess.run(["xdg-open", self.last_video_path])
+                self._open_path(self.last_video_path)
                 self.status_var.set(f"Opened video: {os.path.basename(self.last_video_path)}")
             except Exception as e:
                 messagebox.showerror("Error", f"Could not open video: {e}")
@@ -702,34 +3513,71 @@ class ScreenCaptureApp:
         """Open settings dialog"""
         settings_window = tk.Toplevel(self.root)
         settings_window.title("Settings")
-        settings_window.geometry("400x300")
         settings_window.transient(self.root)
         settings_window.grab_set()
         
-        # Center the window
+        # Center the window, shrunk to fit small screens
         settings_window.update_idletasks()
-        x = (settings_window.winfo_screenwidth() // 2) - (400 // 2)
-        y = (settings_window.winfo_screenheight() // 2) - (300 // 2)
-        settings_window.geometry(f"400x300+{x}+{y}")
+        width = 440
+        height = min(520, settings_window.winfo_screenheight() - 80)
+        x = (settings_window.winfo_screenwidth() // 2) - (width // 2)
+        y = max(0, (settings_window.winfo_screenheight() // 2) - (height // 2))
+        settings_window.geometry(f"{width}x{height}+{x}+{y}")
         
         main_frame = ttk.Frame(settings_window, padding="20")
         main_frame.pack(fill=tk.BOTH, expand=True)
         
         # Title
         title_label = ttk.Label(main_frame, text="Settings", font=('Arial', 14, 'bold'))
-        title_label.pack(pady=(0, 20))
+        title_label.pack(pady=(0, 10))
+        
+        # Buttons are packed before the tabs so they always keep their place at the bottom
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(10, 0))
+        
+        # One tab per area keeps every tab short enough for a laptop screen
+        notebook = ttk.Notebook(main_frame)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        capture_tab, video_tab, replay_tab, storage_tab = (ttk.Frame(notebook, padding="10") for _ in range(4))
+        for tab, text in ((capture_tab, "Capture"), (video_tab, "Video"), (replay_tab, "Replay"),
+                          (storage_tab, "Storage")):
+            notebook.add(tab, text=text)
         
         # Save format
-        format_frame = ttk.Frame(main_frame)
+        format_frame = ttk.Frame(capture_tab)
         format_frame.pack(fill=tk.X, pady=5)
         ttk.Label(format_frame, text="Image Format:").pack(side=tk.LEFT)
         format_var = tk.StringVar(value=self.settings.save_format)
         format_menu = ttk.Combobox(format_frame, textvariable=format_var, 
-                                 values=["PNG", "JPG"], width=10, state="readonly")
+                                 values=IMAGE_FORMATS, width=10, state="readonly")
         format_menu.pack(side=tk.RIGHT)
         
+        # Burst capture
+        burst_count_frame = ttk.Frame(capture_tab)
+        burst_count_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(burst_count_frame, text="Burst Shots (0 = until stopped):").pack(side=tk.LEFT)
+        burst_count_var = tk.StringVar(value=str(self.settings.burst_count))
+        burst_count_entry = ttk.Entry(burst_count_frame, textvariable=burst_count_var, width=10)
+        burst_count_entry.pack(side=tk.RIGHT)
+        
+        burst_interval_frame = ttk.Frame(capture_tab)
+        burst_interval_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(burst_interval_frame, text="Burst Interval (ms):").pack(side=tk.LEFT)
+        burst_interval_var = tk.StringVar(value=str(self.settings.burst_interval_ms))
+        burst_interval_entry = ttk.Entry(burst_interval_frame, textvariable=burst_interval_var, width=10)
+        burst_interval_entry.pack(side=tk.RIGHT)
+        
+        # Image encoding profile
+        image_profile_frame = ttk.Frame(capture_tab)
+        image_profile_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(image_profile_frame, text="Image Encoding:").pack(side=tk.LEFT)
+        image_profile_var = tk.StringVar(value=self.settings.image_profile)
+        image_profile_menu = ttk.Combobox(image_profile_frame, textvariable=image_profile_var,
+                                        values=list(IMAGE_PROFILES), width=10, state="readonly")
+        image_profile_menu.pack(side=tk.RIGHT)
+        
         # Video format
-        video_format_frame = ttk.Frame(main_frame)
+        video_format_frame = ttk.Frame(video_tab)
         video_format_frame.pack(fill=tk.X, pady=5)
         ttk.Label(video_format_frame, text="Video Format:").pack(side=tk.LEFT)
         video_format_var = tk.StringVar(value=self.settings.video_format)
@@ -737,8 +3585,34 @@ class ScreenCaptureApp:
                                        values=["MP4", "AVI", "MOV"], width=10, state="readonly")
         video_format_menu.pack(side=tk.RIGHT)
         
+        # Capture backend
+        capture_backend_frame = ttk.Frame(capture_tab)
+        capture_backend_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(capture_backend_frame, text="Capture Backend:").pack(side=tk.LEFT)
+        capture_backend_var = tk.StringVar(value=self.settings.capture_backend)
+        capture_backend_menu = ttk.Combobox(capture_backend_frame, textvariable=capture_backend_var,
+                                          values=["auto", "mss", "pyautogui"], width=10, state="readonly")
+        capture_backend_menu.pack(side=tk.RIGHT)
+        
+        # Resize filters
+        video_filter_frame = ttk.Frame(video_tab)
+        video_filter_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(video_filter_frame, text="Video Resize Filter:").pack(side=tk.LEFT)
+        video_filter_var = tk.StringVar(value=self.settings.video_resize_filter)
+        video_filter_menu = ttk.Combobox(video_filter_frame, textvariable=video_filter_var,
+                                       values=list(RESIZE_FILTERS), width=10, state="readonly")
+        video_filter_menu.pack(side=tk.RIGHT)
+        
+        still_filter_frame = ttk.Frame(capture_tab)
+        still_filter_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(still_filter_frame, text="Screenshot Resize Filter:").pack(side=tk.LEFT)
+        still_filter_var = tk.StringVar(value=self.settings.still_resize_filter)
+        still_filter_menu = ttk.Combobox(still_filter_frame, textvariable=still_filter_var,
+                                       values=list(RESIZE_FILTERS), width=10, state="readonly")
+        still_filter_menu.pack(side=tk.RIGHT)
+        
         # Video duration
-        duration_frame = ttk.Frame(main_frame)
+        duration_frame = ttk.Frame(video_tab)
         duration_frame.pack(fill=tk.X, pady=5)
         ttk.Label(duration_frame, text="Video Duration (seconds):").pack(side=tk.LEFT)
         duration_var = tk.StringVar(value=str(self.settings.video_duration_seconds))
@@ -746,7 +3620,7 @@ class ScreenCaptureApp:
         duration_entry.pack(side=tk.RIGHT)
         
         # FPS
-        fps_frame = ttk.Frame(main_frame)
+        fps_frame = ttk.Frame(video_tab)
         fps_frame.pack(fill=tk.X, pady=5)
         ttk.Label(fps_frame, text="FPS:").pack(side=tk.LEFT)
         fps_var = tk.StringVar(value=str(self.settings.fps))
@@ -754,15 +3628,47 @@ class ScreenCaptureApp:
         fps_entry.pack(side=tk.RIGHT)
         
         # Clip duration
-        clip_duration_frame = ttk.Frame(main_frame)
+        clip_duration_frame = ttk.Frame(video_tab)
         clip_duration_frame.pack(fill=tk.X, pady=5)
         ttk.Label(clip_duration_frame, text="Clip Duration (seconds):").pack(side=tk.LEFT)
         clip_duration_var = tk.StringVar(value=str(self.settings.clip_duration_seconds))
         clip_duration_entry = ttk.Entry(clip_duration_frame, textvariable=clip_duration_var, width=10)
         clip_duration_entry.pack(side=tk.RIGHT)
         
+        # Video encoder
+        video_encoder_frame = ttk.Frame(video_tab)
+        video_encoder_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(video_encoder_frame, text="Video Encoder:").pack(side=tk.LEFT)
+        video_encoder_var = tk.StringVar(value=self.settings.video_encoder)
+        video_encoder_menu = ttk.Combobox(video_encoder_frame, textvariable=video_encoder_var,
+                                        values=["auto", "ffmpeg", "opencv"], width=10, state="readonly")
+        video_encoder_menu.pack(side=tk.RIGHT)
+        
+        # Frame buffer memory cap
+        frame_buffer_frame = ttk.Frame(video_tab)
+        frame_buffer_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(frame_buffer_frame, text="Frame Buffer (MB):").pack(side=tk.LEFT)
+        frame_buffer_var = tk.StringVar(value=str(self.settings.frame_buffer_mb))
+        frame_buffer_entry = ttk.Entry(frame_buffer_frame, textvariable=frame_buffer_var, width=10)
+        frame_buffer_entry.pack(side=tk.RIGHT)
+        
+        # Replay buffer length and memory cap
+        replay_duration_frame = ttk.Frame(replay_tab)
+        replay_duration_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(replay_duration_frame, text="Replay Length (seconds):").pack(side=tk.LEFT)
+        replay_duration_var = tk.StringVar(value=str(self.settings.replay_duration_seconds))
+        replay_duration_entry = ttk.Entry(replay_duration_frame, textvariable=replay_duration_var, width=10)
+        replay_duration_entry.pack(side=tk.RIGHT)
+        
+        replay_memory_frame = ttk.Frame(replay_tab)
+        replay_memory_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(replay_memory_frame, text="Replay Memory (MB):").pack(side=tk.LEFT)
+        replay_memory_var = tk.StringVar(value=str(self.settings.replay_memory_mb))
+        replay_memory_entry = ttk.Entry(replay_memory_frame, textvariable=replay_memory_var, width=10)
+        replay_memory_entry.pack(side=tk.RIGHT)
+        
         # Resolution preset
-        resolution_preset_frame = ttk.Frame(main_frame)
+        resolution_preset_frame = ttk.Frame(capture_tab)
         resolution_preset_frame.pack(fill=tk.X, pady=5)
         ttk.Label(resolution_preset_frame, text="Resolution Preset:").pack(side=tk.LEFT)
         resolution_preset_var = tk.StringVar(value=self.settings.resolution_preset)
@@ -780,7 +3686,7 @@ class ScreenCaptureApp:
         resolution_preset_menu.bind('<<ComboboxSelected>>', on_preset_change)
         
         # Custom resolution
-        resolution_custom_frame = ttk.Frame(main_frame)
+        resolution_custom_frame = ttk.Frame(capture_tab)
         resolution_custom_frame.pack(fill=tk.X, pady=5)
         ttk.Label(resolution_custom_frame, text="Custom Resolution:").pack(side=tk.LEFT)
         
@@ -796,7 +3702,7 @@ class ScreenCaptureApp:
         height_entry.pack(side=tk.LEFT, padx=(2, 0))
         
         # Save location
-        save_frame = ttk.Frame(main_frame)
+        save_frame = ttk.Frame(storage_tab)
         save_frame.pack(fill=tk.X, pady=5)
         ttk.Label(save_frame, text="Save Location:").pack(side=tk.LEFT)
         save_dir_var = tk.StringVar(value=self.settings.save_dir)
@@ -810,63 +3716,75 @@ class ScreenCaptureApp:
         
         ttk.Button(save_frame, text="Browse", command=browse_save_dir).pack(side=tk.RIGHT)
         
-        # Buttons
-        button_frame = ttk.Frame(main_frame)
-        button_frame.pack(fill=tk.X, pady=(20, 0))
+        # Retention: size, age and count limits per kind (0 = unlimited)
+        retention_vars = {}
+        for kind, label in (("recordings", "Keep Recordings"), ("screenshots", "Keep Screenshots")):
+            retention_frame = ttk.Frame(storage_tab)
+            retention_frame.pack(fill=tk.X, pady=5)
+            ttk.Label(retention_frame, text=f"{label}:").pack(side=tk.LEFT)
+            for field, unit in (("max_files", "files"), ("max_age_days", "days"), ("max_mb", "MB")):
+                var = tk.StringVar(value=str(getattr(self.settings, f"{kind}_{field}")))
+                ttk.Label(retention_frame, text=unit).pack(side=tk.RIGHT, padx=(2, 4))
+                ttk.Entry(retention_frame, textvariable=var, width=6).pack(side=tk.RIGHT)
+                retention_vars[f"{kind}_{field}"] = var
+        
+        min_free_frame = ttk.Frame(storage_tab)
+        min_free_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(min_free_frame, text="Min Free Disk (MB):").pack(side=tk.LEFT)
+        min_free_var = tk.StringVar(value=str(self.settings.min_free_disk_mb))
+        min_free_entry = ttk.Entry(min_free_frame, textvariable=min_free_var, width=10)
+        min_free_entry.pack(side=tk.RIGHT)
+        
+        # Near-duplicate skipping
+        duplicate_frame = ttk.Frame(capture_tab)
+        duplicate_frame.pack(fill=tk.X, pady=5)
+        skip_duplicates_var = tk.BooleanVar(value=self.settings.skip_duplicates)
+        ttk.Checkbutton(duplicate_frame, text="Skip near-duplicate captures", 
+                        variable=skip_duplicates_var).pack(side=tk.LEFT)
+        ttk.Label(duplicate_frame, text="bits").pack(side=tk.RIGHT, padx=(2, 0))
+        duplicate_distance_var = tk.StringVar(value=str(self.settings.duplicate_distance))
+        duplicate_distance_entry = ttk.Entry(duplicate_frame, textvariable=duplicate_distance_var, width=4)
+        duplicate_distance_entry.pack(side=tk.RIGHT)
         
         def save_settings():
             try:
-                # Validate duration
-                duration = int(duration_var.get())
-                if duration < 1 or duration > 3600:
-                    messagebox.showerror("Error", "Video duration must be between 1 and 3600 seconds (1 hour)")
-                    return
-                
-                # Validate FPS
-                fps = int(fps_var.get())
-                if fps < 1 or fps > 60:
-                    messagebox.showerror("Error", "FPS must be between 1 and 60")
-                    return
-                
-                # Validate clip duration
-                clip_duration = int(clip_duration_var.get())
-                if clip_duration < 1 or clip_duration > 300:
-                    messagebox.showerror("Error", "Clip duration must be between 1 and 300 seconds (5 minutes)")
-                    return
-                
-                # Validate resolution
-                width = int(width_var.get())
-                height = int(height_var.get())
-                if width < 320 or width > 7680 or height < 240 or height > 4320:
-                    messagebox.showerror("Error", "Resolution must be between 320x240 and 7680x4320")
-                    return
-                
-                # Handle preset changes
-                preset = resolution_preset_var.get()
-                if preset != self.settings.resolution_preset:
-                    self.settings.set_resolution_preset(preset)
-                    width_var.set(str(self.settings.resolution_width))
-                    height_var.set(str(self.settings.resolution_height))
-                
-                # Update settings
-                self.settings.save_format = format_var.get()
-                self.settings.video_format = video_format_var.get()
-                self.settings.save_dir = save_dir_var.get()
-                self.settings.video_duration_seconds = duration
-                self.settings.fps = fps
-                self.settings.clip_duration_seconds = clip_duration
-                self.settings.resolution_width = width
-                self.settings.resolution_height = height
-                self.settings.resolution_preset = preset
-                
-                # Update app variables
-                self.video_duration_seconds = duration
-                self.frames_per_second = fps
-                self.clip_duration_seconds = clip_duration
-                self.format_var.set(format_var.get())
-                self.video_format_var.set(video_format_var.get())
-                self.save_dir_var.set(save_dir_var.get())
-                
+                numbers = {name: int(var.get()) for name, var in (
+                    ("video_duration_seconds", duration_var), ("fps", fps_var),
+                    ("clip_duration_seconds", clip_duration_var), ("frame_buffer_mb", frame_buffer_var),
+                    ("replay_duration_seconds", replay_duration_var), ("replay_memory_mb", replay_memory_var),
+                    ("burst_count", burst_count_var), ("burst_interval_ms", burst_interval_var),
+                    ("min_free_disk_mb", min_free_var), ("duplicate_distance", duplicate_distance_var),
+                    ("resolution_width", width_var), ("resolution_height", height_var),
+                    *retention_vars.items())}
+            except ValueError:
+                messagebox.showerror("Error", "Please enter whole numbers in the numeric fields")
+                return
+            
+            # A newly picked preset wins over the width and height fields
+            preset = resolution_preset_var.get()
+            if preset != self.settings.resolution_preset:
+                numbers["resolution_width"], numbers["resolution_height"] = RESOLUTION_PRESETS[preset]
+            
+            try:
+                # Validated together against the schema; nothing changes if any value is out of range.
+                # Subscribers (_on_settings_changed) pass the changes on to the rest of the app
+                self.settings.update(
+                    save_format=format_var.get(),
+                    image_profile=image_profile_var.get(),
+                    video_format=video_format_var.get(),
+                    capture_backend=capture_backend_var.get(),
+                    video_resize_filter=video_filter_var.get(),
+                    still_resize_filter=still_filter_var.get(),
+                    save_dir=save_dir_var.get(),
+                    video_encoder=video_encoder_var.get(),
+                    resolution_preset=preset,
+                    skip_duplicates=skip_duplicates_var.get(),
+                    **numbers)
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid setting: {e}")
+                return
+            
+            try:
                 # Save to file
                 self.settings.save_settings()
                 
@@ -876,8 +3794,6 @@ class ScreenCaptureApp:
                 messagebox.showinfo("Success", "Settings saved successfully!")
                 settings_window.destroy()
                 
-            except ValueError:
-                messagebox.showerror("Error", "Please enter valid numbers for duration and resolution")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save settings: {e}")
         
@@ -887,6 +3803,57 @@ class ScreenCaptureApp:
         ttk.Button(button_frame, text="Save", command=save_settings).pack(side=tk.RIGHT, padx=(5, 0))
         ttk.Button(button_frame, text="Cancel", command=cancel).pack(side=tk.RIGHT)
 
+    def _on_settings_changed(self, changes):
+        """Pass changed settings on to the running app (Tk thread)"""
+        if "save_format" in changes:
+            self.format_var.set(changes["save_format"])
+        if "video_format" in changes:
+            self.video_format_var.set(changes["video_format"])
+        if "recording_target" in changes:
+            self.recording_target_var.set(changes["recording_target"])
+        if "metrics_log" in changes:
+            self.metrics_log_var.set(changes["metrics_log"])
+        if "save_dir" in changes:
+            self.save_dir_var.set(changes["save_dir"])
+            self.hash_index.configure(changes["save_dir"])
+        if any(name == "save_dir" or name == "min_free_disk_mb" or name.startswith(("recordings_", "screenshots_"))
+               for name in changes):
+            self._configure_retention()
+        if "capture_backend" in changes and not self.is_recording and self.capture_backend is not None:
+            # Recreated on next capture; a running recording keeps its backend
+            self.capture_backend.close()
+            self.capture_backend = None
+        if "video_duration_seconds" in changes:
+            self.video_duration_seconds = changes["video_duration_seconds"]
+        if "clip_duration_seconds" in changes:
+            self.clip_duration_seconds = changes["clip_duration_seconds"]
+        if "fps" in changes and not self.is_recording:
+            self.frames_per_second = changes["fps"]
+        if self.is_recording:
+            # Applied by the capture thread between frames; other changes wait for the next recording
+            live = {name: value for name, value in changes.items() if name in LIVE_RECORDING_SETTINGS}
+            if live:
+                self.recording_changes.put(live)
+
+    def _configure_retention(self):
+        """Apply the retention settings (and rescan save_dir if it moved) in the background"""
+        threading.Thread(target=self.retention.configure, daemon=True,
+                         args=(self.settings.save_dir, self.settings.retention_limits(),
+                               self.settings.min_free_disk_mb)).start()
+
+    def update_recording_target(self, event=None):
+        self.settings.recording_target = self.recording_target_var.get()
+        self.settings.save_settings()
+        if self.settings.recording_target == "region" and not self.settings.last_region:
+            self.status_var.set("Recording target set to region - select an area first")
+        else:
+            self.status_var.set(f"Recording target set to {self.settings.recording_target}")
+
+    def update_metrics_log(self):
+        self.settings.metrics_log = self.metrics_log_var.get()
+        self.settings.save_settings()
+        self.status_var.set(f"Metrics logging {'on' if self.settings.metrics_log else 'off'}")
+
     def update_format(self, event=None):
         self.settings.save_format = self.format_var.get()
         self.status_var.set(f"Image format set to {self.format_var.get()}")
@@ -898,59 +3865,22 @@ class ScreenCaptureApp:
     def browse_save_dir(self):
         dir_selected = filedialog.askdirectory(initialdir=self.save_dir_var.get())
         if dir_selected:
-            self.save_dir_var.set(dir_selected)
             self.settings.save_dir = dir_selected
             self.status_var.set(f"Save location set to {dir_selected}")
 
     def _update_preview(self, path=None):
         if self.last_image:
-            # Resize for preview
-            img = self.last_image.copy()
-            img.thumbnail((300, 150))
+            # Resize straight to preview size; reducing_gap does a cheap integer
+            # downscale first, so no full-resolution copy is made
+            width, height = self.last_image.size
+            scale = min(300 / width, 150 / height, 1.0)
+            img = self.last_image.resize((max(1, int(width * scale)), max(1, int(height * scale))),
+                                         Image.BILINEAR, reducing_gap=2.0)
             self.preview_imgtk = ImageTk.PhotoImage(img)
             self.preview_label.config(image=self.preview_imgtk)
         else:
             self.preview_label.config(image='')
 
-    def _save_frames_with_instructions(self):
-        """Fallback method to save frames with instructions when video creation fails"""
-        try:
-            # Create a frames directory for this video segment
-            video_start_time = datetime.fromtimestamp(self.current_video_start_time)
-            frames_dir_name = f"frames_{video_start_time.strftime('%Y%m%d_%H%M%S')}"
-            frames_dir = os.path.join(self.settings.save_dir, frames_dir_name)
-            os.makedirs(frames_dir, exist_ok=True)
-            
-            # Copy frames to the frames directory with sequential numbering
-            for i, frame_path in enumerate(self.captured_frames):
-                if os.path.exists(frame_path):
-                    new_frame_name = f"frame_{i:04d}.png"
-                    new_frame_path = os.path.join(frames_dir, new_frame_name)
-                    import shutil
-                    shutil.copy2(frame_path, new_frame_path)
-            
-            # Create a README file with instructions
-            readme_path = os.path.join(frames_dir, "README.txt")
-            with open(readme_path, 'w') as f:
-                f.write("Video Recording Frames\n")
-                f.write("=====================\n\n")
-                f.write(f"Recording started: {video_start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Total frames: {len(self.captured_frames)}\n")
-                f.write(f"Frame rate: {self.frames_per_second} fps\n")
-                f.write(f"Duration: {len(self.captured_frames) / self.frames_per_second:.1f} seconds\n\n")
-                f.write("To create a video from these frames:\n")
-                f.write("1. Install FFmpeg from https://ffmpeg.org/download.html\n")
-                f.write("2. Open command prompt in this directory\n")
-                f.write("3. Run: ffmpeg -framerate 24 -i frame_%04d.png -c:v libx264 -pix_fmt yuv420p output.mp4\n\n")
-                f.write("Or use any video editing software that supports image sequences.\n")
-            
-            # Update status
-            self.status_var.set(f"Frames saved to: {frames_dir_name} (video creation failed)")
-            
-        except Exception as e:
-            print(f"Error saving frames with instructions: {e}")
-            self.status_var.set("Error saving video frames")
-
 # --- Main Entrypoint ---
 def main():
     root = tk.Tk()